@@ -0,0 +1,207 @@
+"""
+algèbre linéaire sur des piles de petites matrices
+cf. 1-13-numpy-linalg-optional, qui travaille sur une seule matrice 3x3
+
+toutes les fonctions prennent des piles de forme (..., k, k), par
+exemple (N, k, k) pour N matrices; au delà de k = 4 on utilise les
+fonctions de np.linalg, qui savent déjà traiter une pile d'un coup;
+jusqu'à k = 4, des formules explicites (cofacteurs) sont plus rapides,
+car elles évitent d'appeler LAPACK une fois par matrice
+
+    >>> A = rng.random((1_000_000, 3, 3))
+    >>> b = rng.random((1_000_000, 3))
+    >>> x = solve(A, b)          # x[i] = np.linalg.solve(A[i], b[i])
+
+les formules explicites sont moins stables numériquement que LAPACK,
+pour des matrices mal conditionnées préférez method='numpy'
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+# jusqu'à cette taille, on utilise les formules explicites
+CLOSED_FORM_MAX = 4
+
+
+def _method(a, method):
+    if method == 'auto':
+        return 'closed' if a.shape[-1] <= CLOSED_FORM_MAX else 'numpy'
+    if method == 'closed' and a.shape[-1] > CLOSED_FORM_MAX:
+        raise ValueError(f"no closed form for k > {CLOSED_FORM_MAX}")
+    if method not in ('closed', 'numpy'):
+        raise ValueError(f"unknown method {method}")
+    return method
+
+
+def _check_square(a):
+    a = np.asarray(a)
+    if a.ndim < 2 or a.shape[-1] != a.shape[-2]:
+        raise np.linalg.LinAlgError(
+            "last 2 dimensions of the array must be square")
+    return a
+
+
+@lru_cache
+def _minors(k):
+    """
+    les indices des k x k mineurs (k-1) x (k-1): rows[i, j] et
+    columns[i, j] sélectionnent la matrice privée de la ligne i
+    et de la colonne j
+    """
+    keep = [[x for x in range(k) if x != i] for i in range(k)]
+    rows = np.array([[keep[i]] * k for i in range(k)])
+    columns = np.array([[keep[j] for j in range(k)]] * k)
+    # de forme (k, k, k-1, k-1), pour du fancy indexing
+    return rows[..., :, np.newaxis], columns[..., np.newaxis, :]
+
+
+def _det(a):
+    """
+    le déterminant par développement selon la première ligne
+    """
+    k = a.shape[-1]
+    if k == 1:
+        return a[..., 0, 0].copy()
+    if k == 2:
+        return a[..., 0, 0] * a[..., 1, 1] - a[..., 0, 1] * a[..., 1, 0]
+    if k == 3:
+        return (a[..., 0, 0] * (a[..., 1, 1] * a[..., 2, 2]
+                                - a[..., 1, 2] * a[..., 2, 1])
+                - a[..., 0, 1] * (a[..., 1, 0] * a[..., 2, 2]
+                                  - a[..., 1, 2] * a[..., 2, 0])
+                + a[..., 0, 2] * (a[..., 1, 0] * a[..., 2, 1]
+                                  - a[..., 1, 1] * a[..., 2, 0]))
+    rows, columns = _minors(k)
+    # les mineurs de la première ligne seulement
+    minors = a[..., rows[0], columns[0]]
+    signs = (-1.) ** np.arange(k)
+    return (a[..., 0, :] * signs * _det(minors)).sum(axis=-1)
+
+
+def _adjugate(a):
+    """
+    la transposée de la matrice des cofacteurs
+    """
+    k = a.shape[-1]
+    if k == 1:
+        return np.ones_like(a)
+    if k <= 3:
+        # composante par composante, sans le tableau de tous les mineurs;
+        # on passe d'abord les composantes en tête, pour que chaque
+        # opération porte sur des tableaux contigus
+        stack = a.shape[:-2]
+        m = np.moveaxis(a.reshape(*stack, k * k), -1, 0)
+        m = m.astype(np.result_type(a, float)).reshape(k, k, *stack)
+        result = np.empty_like(m)
+        if k == 2:
+            result[0, 0], result[1, 1] = m[1, 1], m[0, 0]
+            # les ... pour avoir des vues, même pour une seule matrice
+            np.negative(m[0, 1], out=result[0, 1, ...])
+            np.negative(m[1, 0], out=result[1, 0, ...])
+        else:
+            # avec les indices circulaires, le signe est déjà le bon
+            for i, j in np.ndindex(3, 3):
+                i1, i2, j1, j2 = (i+1) % 3, (i+2) % 3, (j+1) % 3, (j+2) % 3
+                np.multiply(m[i1, j1], m[i2, j2], out=result[j, i, ...])
+                result[j, i, ...] -= m[i1, j2] * m[i2, j1]
+        return np.moveaxis(result.reshape(k * k, *stack), 0, -1).reshape(
+            a.shape)
+    rows, columns = _minors(k)
+    # tous les mineurs d'un coup: (..., k, k, k-1, k-1)
+    cofactors = _det(a[..., rows, columns])
+    cofactors *= (-1.) ** np.add.outer(np.arange(k), np.arange(k))
+    return cofactors.swapaxes(-1, -2)
+
+
+def _invertible(det):
+    if np.any(det == 0):
+        raise np.linalg.LinAlgError("Singular matrix")
+
+
+def det(a, method='auto'):
+    """
+    comme np.linalg.det, sur une pile (..., k, k)
+    """
+    a = _check_square(a)
+    if _method(a, method) == 'numpy':
+        return np.linalg.det(a)
+    return _det(a)
+
+
+def inv(a, method='auto'):
+    """
+    comme np.linalg.inv, sur une pile (..., k, k)
+    """
+    a = _check_square(a)
+    if _method(a, method) == 'numpy':
+        return np.linalg.inv(a)
+    adjugate = _adjugate(a)
+    # le déterminant, à partir des cofacteurs qu'on a déjà
+    det = np.einsum('...j,...j->...', a[..., 0, :], adjugate[..., :, 0])
+    _invertible(det)
+    return adjugate / det[..., np.newaxis, np.newaxis]
+
+
+def solve(a, b, method='auto'):
+    """
+    comme np.linalg.solve, sur une pile (..., k, k); b est soit un
+    seul vecteur (k,), soit une pile de vecteurs (..., k), soit une
+    pile de matrices (..., k, m)
+    """
+    a = _check_square(a)
+    b = np.asarray(b)
+    # comme dans numpy 2: un b à une dimension est un seul vecteur,
+    # broadcasté sur toute la pile; sinon on garde la convention de
+    # numpy 1, b est une pile de vecteurs s'il a une dimension de moins
+    single = b.ndim == 1
+    vector = single or b.ndim == a.ndim - 1
+    if _method(a, method) == 'numpy':
+        if vector:
+            return np.linalg.solve(a, b[..., np.newaxis])[..., 0]
+        return np.linalg.solve(a, b)
+    adjugate = _adjugate(a)
+    det = np.einsum('...j,...j->...', a[..., 0, :], adjugate[..., :, 0])
+    _invertible(det)
+    if single:
+        return (np.einsum('...ij,j->...i', adjugate, b)
+                / det[..., np.newaxis])
+    if vector:
+        return (np.einsum('...ij,...j->...i', adjugate, b)
+                / det[..., np.newaxis])
+    return adjugate @ b / det[..., np.newaxis, np.newaxis]
+
+
+def eig(a):
+    """
+    np.linalg.eig sait déjà traiter une pile
+    """
+    return np.linalg.eig(_check_square(a))
+
+
+def crosscheck(n=1000, seed=0):
+    """
+    compare les formules explicites avec np.linalg, pour k de 1 à 4;
+    retourne la liste des (fonction, k) en désaccord
+    """
+    rng = np.random.default_rng(seed)
+    errors = []
+    for k in range(1, CLOSED_FORM_MAX + 1):
+        a = rng.normal(size=(n, k, k)) + k * np.eye(k)
+        b = rng.normal(size=(n, k))
+        c = rng.normal(size=(n, k, 2))
+        checks = [
+            ('det', det(a), np.linalg.det(a)),
+            ('inv', inv(a), np.linalg.inv(a)),
+            ('solve', solve(a, b), solve(a, b, method='numpy')),
+            ('solve', solve(a, c), np.linalg.solve(a, c)),
+            ('solve', solve(a, b[0]), solve(a, b[0], method='numpy')),
+        ]
+        errors.extend((name, k) for name, mine, theirs in checks
+                      if not np.allclose(mine, theirs))
+    return errors
+
+
+if __name__ == '__main__':
+    errors = crosscheck()
+    print("OK" if not errors else f"KO {errors}")
@@ -0,0 +1,430 @@
+"""
+benchmarks for the timing experiments that the notebooks do by hand
+
+each benchmark is a function that takes a size, does its setup, and
+returns the (argument-less) function to be timed; it is registered
+with the sizes it should be run with, using the @benchmark decorator
+
+running this script times all benchmarks, repeatedly, and compares
+the results with a stored baseline, so that we notice when e.g.
+a numpy or pandas upgrade in requirements.txt makes one of them slower
+
+    python benchmarks.py --save      # record the baseline
+    python benchmarks.py             # compare with the baseline
+    python benchmarks.py -k sin      # only the ones whose name has 'sin'
+"""
+
+import io
+import sys
+import json
+import timeit
+import warnings
+import platform
+import statistics
+from pathlib import Path
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+import fused
+import batched
+import indices
+import mosaic
+import sound
+import verify
+
+BASELINE = "benchmarks-baseline.json"
+
+# name -> (function, sizes)
+BENCHMARKS = {}
+
+
+def benchmark(*sizes):
+    def decorator(function):
+        BENCHMARKS[function.__name__] = (function, sizes)
+        return function
+    return decorator
+
+
+########## 1-02: creating arrays
+
+@benchmark(10**3, 10**4, 10**5, 10**6)
+def array_from_list(n):
+    l = [0.] * n
+    return lambda: np.array(l)
+
+@benchmark(10**3, 10**4, 10**5, 10**6)
+def array_zeros(n):
+    return lambda: np.zeros(shape=(n,))
+
+@benchmark(10**3, 10**4, 10**5, 10**6)
+def array_empty(n):
+    return lambda: np.empty(shape=(n,))
+
+
+########## 1-04: python loop vs vectorized
+
+@benchmark(10**3, 10**4, 10**5)
+def sin_loop(n):
+    x = np.linspace(0, 2*np.pi, n)
+    def run():
+        y = []
+        for e in x:
+            y.append(np.sin(e))
+        return y
+    return run
+
+@benchmark(10**3, 10**4, 10**5, 10**6)
+def sin_vectorized(n):
+    x = np.linspace(0, 2*np.pi, n)
+    return lambda: np.sin(x)
+
+
+########## 1-04: squaring an array
+
+@benchmark(10**4, 10**5)
+def square_for(n):
+    a = np.arange(n)
+    def run():
+        result = np.empty_like(a)
+        for i in range(len(a)):
+            result[i] = a[i] ** 2
+        return result
+    return run
+
+@benchmark(10**4, 10**5)
+def square_comprehension(n):
+    a = np.arange(n)
+    return lambda: [x**2 for x in a]
+
+@benchmark(10**4, 10**6)
+def square_power_operator(n):
+    a = np.arange(n)
+    return lambda: a ** 2
+
+@benchmark(10**4, 10**6)
+def square_np_power(n):
+    a = np.arange(n)
+    return lambda: np.power(a, 2)
+
+@benchmark(10**4, 10**6)
+def square_np_square(n):
+    a = np.arange(n)
+    return lambda: np.square(a)
+
+
+########## 1-05: pipeline, naive vs fused vs cache-blocked
+
+@benchmark(10**4, 10**6, 10**7)
+def pipeline_naive(n):
+    x = np.linspace(0, 2*np.pi, n)
+    return lambda: fused.pipeline(x)
+
+@benchmark(10**4, 10**6, 10**7)
+def pipeline_fused(n):
+    x = np.linspace(0, 2*np.pi, n)
+    pipeline = fused.Pipeline(fused.pipeline)
+    return lambda: pipeline(x)
+
+@benchmark(10**4, 10**6, 10**7)
+def pipeline_blocked(n):
+    x = np.linspace(0, 2*np.pi, n)
+    pipeline = fused.Pipeline(fused.pipeline)
+    return lambda: pipeline.blocked(x)
+
+@benchmark(10**4, 10**6, 10**7)
+def pipeline_blocked_1thread(n):
+    x = np.linspace(0, 2*np.pi, n)
+    pipeline = fused.Pipeline(fused.pipeline)
+    return lambda: pipeline.blocked(x, jobs=1)
+
+
+########## 1-07: unravel_index, one index or a million at once
+
+UNRAVEL_SHAPE = (20, 30, 40, 50)
+
+def _flat_indices(n):
+    """
+    a plain scalar for n == 1, like e.g. tab.argmax()
+    """
+    rng = np.random.default_rng(0)
+    flat = rng.integers(0, np.prod(UNRAVEL_SHAPE), n)
+    return int(flat[0]) if n == 1 else flat
+
+@benchmark(1, 10**6)
+def unravel_numpy(n):
+    flat = _flat_indices(n)
+    return lambda: np.unravel_index(flat, UNRAVEL_SHAPE)
+
+@benchmark(1, 10**6)
+def unravel_batch(n):
+    flat = _flat_indices(n)
+    return lambda: indices.unravel_index(flat, UNRAVEL_SHAPE)
+
+@benchmark(1, 10**6)
+def unravel_batch_fortran(n):
+    flat = _flat_indices(n)
+    return lambda: indices.unravel_index(flat, UNRAVEL_SHAPE, order='F')
+
+@benchmark(1, 10**6)
+def ravel_multi_index_numpy(n):
+    coords = np.unravel_index(_flat_indices(n), UNRAVEL_SHAPE)
+    return lambda: np.ravel_multi_index(coords, UNRAVEL_SHAPE)
+
+@benchmark(1, 10**6)
+def ravel_multi_index_batch(n):
+    coords = np.unravel_index(_flat_indices(n), UNRAVEL_SHAPE)
+    return lambda: indices.ravel_multi_index(coords, UNRAVEL_SHAPE)
+
+
+########## 1-10: patchwork, one tile at a time vs all at once
+
+def _tiles(n, images):
+    rng = np.random.default_rng(0)
+    shape = (n, 16, 16, 3) if images else (n, 3)
+    return rng.integers(0, 256, shape, dtype=np.uint8)
+
+@benchmark(10**2, 10**4)
+def mosaic_loop(n):
+    tiles = _tiles(n, images=True)
+    side = int(n ** 0.5)
+    def run():
+        out = np.empty((side * 16, side * 16, 3), dtype=np.uint8)
+        for k, tile in enumerate(tiles):
+            i, j = divmod(k, side)
+            out[i*16:(i+1)*16, j*16:(j+1)*16] = tile
+        return out
+    return run
+
+@benchmark(10**2, 10**4)
+def mosaic_images(n):
+    tiles = _tiles(n, images=True)
+    side = int(n ** 0.5)
+    return lambda: mosaic.mosaic(tiles, (side, side))
+
+@benchmark(10**2, 10**4)
+def mosaic_colors(n):
+    tiles = _tiles(n, images=False)
+    side = int(n ** 0.5)
+    return lambda: mosaic.mosaic(tiles, (side, side), tile=(16, 16))
+
+
+########## 1-13: solving n 3x3 systems
+
+def _systems(n):
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(n, 3, 3)) + 3 * np.eye(3), rng.normal(size=(n, 3))
+
+@benchmark(10**3, 10**4)
+def solve_loop(n):
+    a, b = _systems(n)
+    return lambda: [np.linalg.solve(a[i], b[i]) for i in range(n)]
+
+@benchmark(10**3, 10**4, 10**6)
+def solve_numpy_stack(n):
+    a, b = _systems(n)
+    return lambda: batched.solve(a, b, method='numpy')
+
+@benchmark(10**3, 10**4, 10**6)
+def solve_closed_form(n):
+    a, b = _systems(n)
+    return lambda: batched.solve(a, b)
+
+@benchmark(10**3, 10**4, 10**6)
+def inv_numpy_stack(n):
+    a, _ = _systems(n)
+    return lambda: np.linalg.inv(a)
+
+@benchmark(10**3, 10**4, 10**6)
+def inv_closed_form(n):
+    a, _ = _systems(n)
+    return lambda: batched.inv(a)
+
+
+########## 1-13: verifying an n x n inverse
+
+def _inverse(n):
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(n, n)) + n ** 0.5 * np.eye(n)
+    return a, np.linalg.inv(a)
+
+@benchmark(500, 2000)
+def verify_inverse_exact(n):
+    a, a_inv = _inverse(n)
+    return lambda: np.allclose(a @ a_inv, np.eye(n))
+
+@benchmark(500, 2000)
+def verify_inverse_freivalds(n):
+    a, a_inv = _inverse(n)
+    return lambda: verify.check_inverse(a, a_inv)
+
+########## 2-10: resampling a sound 4 times lower, 10 seconds and 10 minutes
+
+SOUND_RATE = 44100
+
+def _sound(n):
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, n)
+
+@benchmark(SOUND_RATE * 10, SOUND_RATE * 600)
+def resample_pandas(n):
+    period = pd.Timedelta(1 / SOUND_RATE, unit='s')
+    series = pd.Series(_sound(n), index=pd.date_range(
+        "2024-01-01", periods=n, freq=period))
+    return lambda: series.resample(4 * period).mean()
+
+@benchmark(SOUND_RATE * 10, SOUND_RATE * 600)
+def resample_polyphase(n):
+    signal = _sound(n)
+    return lambda: sound.resample(signal, 1, 4)
+
+
+########## 2-11: parsing dates, slow and fast
+
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+def _dates(n):
+    """
+    n dates formatted like in the Fremont dataset
+    """
+    index = pd.date_range("2012-10-03", periods=n, freq="h")
+    return pd.Series(index.strftime(DATE_FORMAT))
+
+def _quietly(function):
+    """
+    pandas warns about the slow path, which is what we want to measure
+    """
+    def run():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return function()
+    return run
+
+# the slow ones are really slow, hence the smaller sizes
+@benchmark(10**3, 10**4)
+def dates_read_csv_parse_dates(n):
+    text = pd.DataFrame({'Date': _dates(n), 'Total': 1}).to_csv(index=False)
+    return _quietly(lambda: pd.read_csv(io.StringIO(text), index_col='Date',
+                                        parse_dates=True))
+
+@benchmark(10**3, 10**4)
+def dates_to_datetime_inferred(n):
+    dates = _dates(n)
+    return _quietly(lambda: pd.to_datetime(dates))
+
+@benchmark(10**3, 10**4, 10**5)
+def dates_to_datetime_format(n):
+    dates = _dates(n)
+    return lambda: pd.to_datetime(dates, format=DATE_FORMAT)
+
+
+########## the runner
+
+def measure(function, repeat=7, budget=0.2):
+    """
+    time function() repeat times, each time running it as many
+    times as fit in budget seconds (and at least once)
+
+    returns a dict with the statistics of the time for one call
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= budget or number >= 10**6:
+            break
+        number *= 10
+    times = [time / number for time in timer.repeat(repeat, number)]
+    # no spread to speak of with a single run (-r 1)
+    stdev = statistics.stdev(times) if len(times) > 1 else 0.
+    return dict(
+        min=min(times), median=statistics.median(times),
+        mean=statistics.mean(times), stdev=stdev,
+        number=number, repeat=repeat)
+
+
+def run(pattern="", repeat=7):
+    """
+    returns a dict 'name[size]' -> statistics
+    """
+    results = {}
+    for name, (function, sizes) in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for size in sizes:
+            key = f"{name}[{size}]"
+            results[key] = stats = measure(function(size), repeat=repeat)
+            print(f"{key:<40} {stats['median']*1e6:12.2f} µs"
+                  f" ± {stats['stdev']*1e6:.2f}")
+    return results
+
+
+def versions():
+    return dict(python=platform.python_version(),
+                numpy=np.__version__, pandas=pd.__version__)
+
+
+def compare(results, baseline, threshold=1.25):
+    """
+    compares the best times with the ones in the baseline
+
+    returns the list of keys that got slower by more than threshold
+    """
+    for module, version in baseline['versions'].items():
+        if versions()[module] != version:
+            print(f"{module}: {version} -> {versions()[module]}")
+    regressions = []
+    for key, stats in results.items():
+        if key not in baseline['results']:
+            continue
+        ratio = stats['min'] / baseline['results'][key]['min']
+        if ratio > threshold:
+            regressions.append(key)
+            print(f"SLOWER {key:<40} x{ratio:.2f}")
+        elif ratio < 1 / threshold:
+            print(f"faster {key:<40} x{ratio:.2f}")
+    return regressions
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-k", "--pattern", default="",
+                        help="only run the benchmarks whose name has this")
+    parser.add_argument("-r", "--repeat", type=int, default=7)
+    parser.add_argument("-b", "--baseline", default=BASELINE)
+    parser.add_argument("-s", "--save", action='store_true', default=False,
+                        help="store the results as the new baseline")
+    parser.add_argument("-t", "--threshold", type=float, default=1.25,
+                        help="how much slower before we report a regression")
+    parser.add_argument("-l", "--list", action='store_true', default=False)
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    if args.list:
+        for name, (_, sizes) in BENCHMARKS.items():
+            print(f"{name} {sizes}")
+        return
+
+    results = run(args.pattern, repeat=args.repeat)
+    baseline = Path(args.baseline)
+    if args.save:
+        if baseline.exists():
+            with baseline.open() as reader:
+                previous = json.load(reader)['results']
+            # so that -k can be used to refresh only some benchmarks
+            results = previous | results
+        with baseline.open('w') as writer:
+            json.dump(dict(versions=versions(), results=results),
+                      writer, indent=2)
+            writer.write("\n")
+        return
+    if not baseline.exists():
+        print(f"no baseline in {baseline} - use --save to create one")
+        return
+    with baseline.open() as reader:
+        if compare(results, json.load(reader), threshold=args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+prévoir le résultat d'un broadcasting, sans rien allouer
+cf. are_broadcast_compatible et test_compatibility dans 1-08-numpy-broadcast
+
+test_compatibility crée des tableaux pour savoir si ça marche; ici on
+calcule, à partir des seules formes, la forme du résultat, les axes où
+chaque opérande est répété (son stride vaut 0), et la taille en octets
+du résultat; ce qui permet aussi de refuser une opération trop grosse
+avant qu'elle n'alloue quoi que ce soit, comme par exemple l'hypercube
+de nb_sides ** nb_dice cases dans le TP sur les dés
+
+    >>> guarded(np.add, cube, sides.reshape(shape), budget=2**30)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# shape: la forme du résultat
+# stride0: pour chaque opérande, les axes (du résultat) où il est répété
+# nbytes: la taille du résultat
+Plan = namedtuple('Plan', ['shape', 'stride0', 'nbytes'])
+
+
+class BudgetExceeded(MemoryError):
+    """
+    l'opération allouerait plus que le budget autorisé
+    """
+
+
+def plan(*shapes, dtype=float, budget=None):
+    """
+    la forme, les axes répétés, et la taille du broadcasting de shapes;
+    dtype peut aussi être un tuple, quand il y a plusieurs résultats
+
+    lève ValueError si les formes ne sont pas compatibles, et
+    BudgetExceeded si budget (en octets) est fourni et dépassé
+    """
+    shapes = [tuple(int(dim) for dim in shape) for shape in shapes]
+    ndim = max((len(shape) for shape in shapes), default=0)
+    # on aligne les formes à droite, en complétant avec des 1 à gauche
+    padded = [(1,) * (ndim - len(shape)) + shape for shape in shapes]
+    result = []
+    for axis, dims in enumerate(zip(*padded)):
+        others = {dim for dim in dims if dim != 1}
+        if len(others) > 1:
+            raise ValueError(
+                f"shapes {' '.join(map(str, shapes))} are not compatible"
+                f" on axis {axis - ndim}: {sorted(others)}")
+        result.append(others.pop() if others else 1)
+    stride0 = tuple(
+        tuple(axis for axis, (dim, size) in enumerate(zip(shape, result))
+              if dim == 1 and size != 1)
+        for shape in padded)
+    # en entiers python, pour ne pas déborder sur les tailles absurdes
+    dtypes = dtype if isinstance(dtype, tuple) else (dtype,)
+    nbytes = sum(np.dtype(dtype).itemsize for dtype in dtypes)
+    for size in result:
+        nbytes *= size
+    if budget is not None and nbytes > budget:
+        raise BudgetExceeded(
+            f"broadcasting to {tuple(result)} would allocate"
+            f" {nbytes} bytes, over the budget of {budget}")
+    return Plan(tuple(result), stride0, nbytes)
+
+
+def are_broadcast_compatible(*shapes):
+    """
+    la question du notebook, mais pour un nombre quelconque de formes
+    """
+    try:
+        plan(*shapes)
+        return True
+    except ValueError:
+        return False
+
+
+def guarded(function, *arrays, budget, **kwargs):
+    """
+    appelle function(*arrays, **kwargs) - typiquement une ufunc -
+    seulement si le résultat tient dans budget octets
+    """
+    arrays = [np.asarray(array) for array in arrays]
+    if isinstance(function, np.ufunc):
+        # le type d'un résultat peut différer de celui des entrées
+        # (np.sqrt sur des entiers...), on le demande à la ufunc
+        # elle-même, sur des tableaux vides
+        probe = {key: value for key, value in kwargs.items()
+                 if key not in ('out', 'where')}
+        results = function(*(np.empty(0, dtype=array.dtype)
+                             for array in arrays), **probe)
+        if function.nout == 1:
+            results = (results,)
+        dtype = tuple(result.dtype for result in results)
+    else:
+        dtype = kwargs.get('dtype') or np.result_type(*arrays)
+    plan(*(array.shape for array in arrays), dtype=dtype, budget=budget)
+    return function(*arrays, **kwargs)
@@ -0,0 +1,362 @@
+"""
+compter les tirages de dés - cf. le notebook 1-11-numpy-TP-dices-advanced
+
+la version force brute du notebook construit un hypercube de
+nb_sides ** nb_dice cases; ici on calcule la distribution complète
+des sommes en coût polynomial, en remarquant que le nombre de tirages
+qui donnent la somme s, c'est le coefficient de x**s dans le polynôme
+
+    (x + x**2 + ... + x**nb_sides) ** nb_dice
+
+et que multiplier des polynômes, c'est convoluer leurs coefficients
+"""
+
+import math
+import itertools
+from functools import lru_cache
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def dice(target, nb_dice=2, nb_sides=6):
+    """
+    la version force brute du notebook, qui sert de référence
+    """
+    sides = np.arange(1, nb_sides+1)
+    cube = sides
+    shape = [nb_sides]
+    for _dimension in range(nb_dice - 1):
+        shape.append(1)
+        cube = cube + sides.reshape(shape)
+    return np.sum(cube == target)
+
+
+# la taille mémoire que s'autorise counts_bruteforce, en octets
+BUDGET = 2**27
+
+
+def counts_bruteforce(nb_dice=2, nb_sides=6, budget=BUDGET):
+    """
+    la force brute, mais avec une mémoire bornée par budget, quel que
+    soit le nombre de dés; le résultat est le même que celui de counts()
+
+    on découpe l'hypercube en tranches: les dés 'intérieurs' forment
+    un petit cube, dont on précalcule les sommes une fois pour toutes,
+    et on parcourt les valeurs des dés 'extérieurs' avec une boucle;
+    chaque tranche est calculée dans le même buffer, et comptée d'un coup
+    pour toutes les sommes avec np.bincount
+    """
+    # le buffer et le petit cube sont en intp, car np.bincount
+    # ferait sinon une copie de tout le buffer dans ce type
+    itemsize = np.dtype(np.intp).itemsize
+    inner = 1
+    while (inner < nb_dice
+           and 2 * itemsize * nb_sides ** (inner+1) <= budget):
+        inner += 1
+    outer = nb_dice - inner
+
+    sides = np.arange(1, nb_sides+1)
+    cube = np.zeros((nb_sides,) * inner, dtype=np.intp)
+    for axis in range(inner):
+        shape = [1] * inner
+        shape[axis] = nb_sides
+        # en place, on n'alloue rien de plus
+        cube += sides.reshape(shape)
+    cube = cube.ravel()
+    buffer = np.empty_like(cube)
+
+    result = np.zeros(nb_dice * nb_sides + 1, dtype=np.int64)
+    for outer_sides in itertools.product(sides, repeat=outer):
+        np.add(cube, sum(outer_sides), out=buffer)
+        result += np.bincount(buffer, minlength=len(result))
+    return result
+
+
+def _power(poly, n, convolve):
+    """
+    poly ** n par exponentiation rapide, soit log2(n) convolutions
+    """
+    result = np.ones(1, dtype=poly.dtype)
+    while n:
+        if n & 1:
+            result = convolve(result, poly)
+        n >>= 1
+        if n:
+            poly = convolve(poly, poly)
+    return result
+
+
+def _fft_power(poly, n):
+    """
+    poly ** n avec une seule FFT: dans l'espace des fréquences,
+    la convolution devient un produit, et donc la puissance une puissance
+    le résultat est en flottants
+    """
+    size = n * (len(poly) - 1) + 1
+    # une taille en puissance de 2, et au moins size pour éviter le repliement
+    length = 1 << (size - 1).bit_length()
+    spectrum = np.fft.rfft(poly, length) ** n
+    return np.fft.irfft(spectrum, length)[:size]
+
+
+# au delà de cette taille de polynôme, la FFT est plus rapide
+FFT_THRESHOLD = 512
+
+
+def counts(nb_dice=2, nb_sides=6, method='auto'):
+    """
+    la distribution complète: un tableau d'entiers, indexé par la somme
+    (de 0 à nb_dice * nb_sides), qui donne le nombre de tirages correspondants
+
+    les résultats sont exacts: en int64 tant que ça tient, et sinon
+    en entiers Python (dtype=object), plus lents mais sans limite
+
+    method peut valoir 'direct', 'fft' ou 'auto'; la FFT calcule en
+    flottants, on ne s'en sert donc que si l'arrondi reste exact
+    """
+    # on travaille sur les valeurs - 1 (de 0 à nb_sides - 1), que l'on
+    # décale de nb_dice à la fin, le polynôme est plus court
+    total = nb_sides ** nb_dice
+    size = nb_dice * (nb_sides - 1) + 1
+    length = 1 << (size - 1).bit_length()
+    # l'erreur de la FFT est de l'ordre de total * eps * (nb_dice + log(length))
+    fft_exact = total * (nb_dice + length.bit_length()) < 2**49
+    if method == 'auto':
+        method = 'fft' if (size > FFT_THRESHOLD and fft_exact) else 'direct'
+    if method == 'fft':
+        if not fft_exact:
+            raise ValueError(f"the fft would not be exact for "
+                             f"{nb_dice} dice with {nb_sides} sides")
+        shifted = np.rint(_fft_power(np.ones(nb_sides), nb_dice))
+        shifted = shifted.astype(np.int64)
+    elif method == 'direct':
+        dtype = np.int64 if total < 2**63 else object
+        shifted = _power(np.ones(nb_sides, dtype=dtype), nb_dice, np.convolve)
+    else:
+        raise ValueError(f"unknown method {method}")
+    result = np.zeros(nb_dice * nb_sides + 1, dtype=shifted.dtype)
+    result[nb_dice:] = shifted
+    return result
+
+
+def probabilities(nb_dice=2, nb_sides=6):
+    """
+    comme counts, mais divisé par le nombre total de tirages
+    pour les grandes tailles, c'est une seule FFT, en flottants
+    """
+    size = nb_dice * (nb_sides - 1) + 1
+    if size <= FFT_THRESHOLD:
+        return counts(nb_dice, nb_sides, 'direct') / nb_sides ** nb_dice
+    shifted = _fft_power(np.full(nb_sides, 1 / nb_sides), nb_dice)
+    # la FFT peut produire des valeurs très légèrement négatives
+    np.clip(shifted, 0, None, out=shifted)
+    result = np.zeros(nb_dice * nb_sides + 1)
+    result[nb_dice:] = shifted
+    return result
+
+
+def dice_poly(target, nb_dice=2, nb_sides=6):
+    """
+    même résultat que dice(), mais en temps polynomial
+    """
+    if not nb_dice <= target <= nb_dice * nb_sides:
+        return 0
+    return counts(nb_dice, nb_sides)[target]
+
+
+# au delà de ce nombre de cases, on convolue plutôt que de broadcaster
+BROADCAST_THRESHOLD = 2**16
+
+
+@lru_cache(maxsize=128)
+def _distribution(key, method):
+    """
+    la version mémoïsée de distribution(), key est un tuple de
+    (valeurs, poids) qui sont eux-mêmes des tuples, pour être hashables
+    """
+    faces = [np.array(values, dtype=np.intp) for values, _ in key]
+    weights = [np.array(weights, dtype=float) for _, weights in key]
+    weights = [weight / weight.sum() for weight in weights]
+    size = sum(int(values.max()) for values in faces) + 1
+    if method == 'auto':
+        cells = math.prod(len(values) for values in faces)
+        method = 'broadcast' if cells <= BROADCAST_THRESHOLD else 'convolve'
+    if method == 'broadcast':
+        # comme dans le notebook: l'hypercube des sommes, et celui
+        # des probabilités correspondantes, puis on les compte d'un coup
+        sums = np.zeros((), dtype=np.intp)
+        probas = np.ones(())
+        for values, weight in zip(faces, weights):
+            sums = np.add.outer(sums, values)
+            probas = np.multiply.outer(probas, weight)
+        result = np.bincount(sums.ravel(), weights=probas.ravel(),
+                             minlength=size)
+    elif method == 'convolve':
+        # un dé, c'est un polynôme dont les coefficients sont les poids
+        result = np.ones(1)
+        for values, weight in zip(faces, weights):
+            result = np.convolve(result, np.bincount(values, weights=weight))
+        result = np.concatenate([result, np.zeros(size - len(result))])
+    else:
+        raise ValueError(f"unknown method {method}")
+    # il est partagé par tous les appels, on le protège
+    result.flags.writeable = False
+    return result
+
+
+def distribution(faces, weights=None, method='auto'):
+    """
+    la distribution de la somme de dés tous différents
+
+    faces est une liste, avec pour chaque dé la liste des valeurs
+    (entières, positives) de ses faces; weights, s'il est fourni, donne
+    pour chaque dé les poids de ses faces (normalisés à 1 pour chaque dé)
+
+    method peut valoir 'broadcast' (l'hypercube, pour peu de dés),
+    'convolve' ou 'auto'
+
+    retourne le tableau des probabilités, indexé par la somme;
+    il est en lecture seule, car mémoïsé pour les appels suivants
+    """
+    if weights is None:
+        weights = [None] * len(faces)
+    if len(weights) != len(faces):
+        raise ValueError("need as many weights as dice")
+    key = []
+    for values, weight in zip(faces, weights):
+        values = tuple(int(value) for value in values)
+        if weight is None:
+            weight = (1,) * len(values)
+        weight = tuple(float(w) for w in weight)
+        if len(weight) != len(values):
+            raise ValueError("need as many weights as faces")
+        if not values or min(values) < 0:
+            raise ValueError("faces must be non-empty and non-negative")
+        key.append((values, weight))
+    return _distribution(tuple(key), method)
+
+
+def probability(target, faces, weights=None):
+    """
+    la probabilité que la somme des dés vaille target;
+    pour plusieurs cibles sur les mêmes dés, la distribution
+    n'est calculée que la première fois
+    """
+    result = distribution(faces, weights)
+    return result[target] if 0 <= target < len(result) else 0.
+
+
+def _hits(seed, target, nb_dice, nb_sides, nb_samples, batch):
+    """
+    tire nb_samples lancers, par paquets de batch, et retourne
+    le nombre de ceux dont la somme vaut target
+
+    c'est ce qui tourne dans les processus; seed est une SeedSequence
+    différente pour chaque appel, les flux aléatoires sont donc indépendants
+    """
+    generator = np.random.default_rng(seed)
+    # les buffers sont alloués une fois, et réutilisés pour chaque paquet
+    draws = np.empty((batch, nb_dice))
+    sums = np.empty(batch)
+    hits = 0
+    # floor(u * nb_sides) va de 0 à nb_sides - 1, on décale la cible
+    shifted = target - nb_dice
+    for beg in range(0, nb_samples, batch):
+        size = min(batch, nb_samples - beg)
+        chunk = draws[:size]
+        generator.random(out=chunk)
+        chunk *= nb_sides
+        np.floor(chunk, out=chunk)
+        np.sum(chunk, axis=1, out=sums[:size])
+        hits += int(np.count_nonzero(sums[:size] == shifted))
+    return hits
+
+
+def wilson(hits, nb_samples, confidence=0.95):
+    """
+    l'intervalle de confiance (de Wilson) pour une proportion
+    hits / nb_samples; contrairement à l'intervalle 'naïf',
+    il reste correct quand la proportion est proche de 0 ou 1
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = hits / nb_samples
+    denominator = 1 + z**2 / nb_samples
+    center = (p + z**2 / (2 * nb_samples)) / denominator
+    half = (z / denominator) * math.sqrt(
+        p * (1 - p) / nb_samples + z**2 / (4 * nb_samples**2))
+    return center - half, center + half
+
+
+def monte_carlo(target, nb_dice=2, nb_sides=6, precision=1e-3,
+                confidence=0.95, seed=None, jobs=1,
+                batch=2**14, task=2**20, max_samples=10**9):
+    """
+    estime la probabilité d'obtenir target, par tirage aléatoire
+
+    on tire des lancers par paquets de task (dans jobs processus
+    si jobs > 1), jusqu'à ce que l'intervalle de confiance soit plus
+    étroit que 2 * precision, ou que l'on ait tiré max_samples lancers
+
+    retourne (estimation, (bas, haut), nombre de lancers)
+    avec le même seed, le résultat est reproductible
+    """
+    seed = np.random.SeedSequence(seed)
+    hits = nb_samples = 0
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        while nb_samples < max_samples:
+            sizes = [min(task, max_samples - nb_samples - i * task)
+                     for i in range(jobs)]
+            sizes = [size for size in sizes if size > 0]
+            # une sous-séquence par tâche: des flux indépendants
+            arguments = [(child, target, nb_dice, nb_sides, size, batch)
+                         for child, size in zip(seed.spawn(len(sizes)), sizes)]
+            if pool is None:
+                results = [_hits(*args) for args in arguments]
+            else:
+                results = pool.map(_hits, *zip(*arguments))
+            hits += sum(results)
+            nb_samples += sum(sizes)
+            low, high = wilson(hits, nb_samples, confidence)
+            if (high - low) / 2 <= precision:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return hits / nb_samples, (low, high), nb_samples
+
+
+def crosscheck(max_dice=5, max_sides=6):
+    """
+    vérifie counts() et counts_bruteforce() contre la force brute
+    du notebook, sur les petites tailles
+
+    retourne la liste des (nb_dice, nb_sides, target) en désaccord
+    """
+    errors = []
+    for nb_dice in range(1, max_dice+1):
+        for nb_sides in range(1, max_sides+1):
+            expected = [dice(target, nb_dice, nb_sides)
+                        for target in range(nb_dice * nb_sides + 1)]
+            results = [counts(nb_dice, nb_sides, method)
+                       for method in ('direct', 'fft')]
+            # un budget ridicule pour avoir plusieurs tranches
+            results.append(counts_bruteforce(nb_dice, nb_sides, budget=64))
+            for result in results:
+                for target, count in enumerate(expected):
+                    if result[target] != count:
+                        errors.append((nb_dice, nb_sides, target))
+            # des dés tous pareils, par les deux méthodes
+            faces = [range(1, nb_sides+1)] * nb_dice
+            for method in ('broadcast', 'convolve'):
+                result = distribution(faces, method=method)
+                if not np.allclose(result, probabilities(nb_dice, nb_sides)):
+                    errors.append((nb_dice, nb_sides, method))
+    return errors
+
+
+if __name__ == '__main__':
+    errors = crosscheck()
+    print("OK" if not errors else f"KO {errors}")
@@ -0,0 +1,135 @@
+"""
+execute the notebooks of the book in parallel, ahead of 'jupyter-book build'
+
+the notebooks listed in _toc.yml are independent from each other, so
+we run them on a pool of processes - one per core by default - each
+notebook getting its own kernel; the executed notebooks are then stored
+in the jupyter-book cache, where 'jupyter-book build' will find them
+instead of running them again, one after the other
+"""
+
+import os
+import time
+import importlib
+from fnmatch import fnmatch
+from pathlib import Path
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+from jupyter_cache import get_cache
+from jupyter_cache.base import CacheBundleIn
+
+# the per-cell cache
+execute_cells = importlib.import_module("execute-cells")
+
+# where jupyter-book looks for executed notebooks
+BOOK_CACHE = "_build/.jupyter_cache"
+
+NOTEBOOK_SUFFIXES = ('.py', '.md', '.ipynb')
+
+
+def toc_notebooks(toc="_toc.yml", config="_config.yml"):
+    """
+    the notebooks mentioned in the toc, minus the ones that
+    the config says are not to be executed
+    """
+    with open(toc) as reader:
+        toc = yaml.safe_load(reader)
+    with open(config) as reader:
+        config = yaml.safe_load(reader)
+    excludes = config.get('execute', {}).get('exclude_patterns', [])
+
+    patterns = [toc['root']]
+    for part in toc.get('parts', []):
+        for chapter in part.get('chapters', []):
+            patterns.append(chapter.get('glob') or chapter.get('file'))
+
+    notebooks = []
+    for pattern in patterns:
+        for path in sorted(Path('.').glob(f"{pattern}.*")):
+            if path.suffix not in NOTEBOOK_SUFFIXES:
+                continue
+            if any(fnmatch(str(path.absolute()), exclude)
+                   for exclude in excludes):
+                continue
+            if path not in notebooks:
+                notebooks.append(path)
+    return notebooks
+
+
+def execute_one(path, cache, timeout):
+    """
+    runs in a worker process; returns (path, notebook, seconds)
+    """
+    beg = time.perf_counter()
+    notebook, *_ = execute_cells.execute(
+        path, cache=cache, timeout=timeout, verbose=False)
+    return path, notebook, time.perf_counter() - beg
+
+
+def execute_book(notebooks, jobs=None, cache=execute_cells.CACHE,
+                 book_cache=BOOK_CACHE, timeout=None):
+    """
+    returns a dict path -> seconds, for the notebooks that could be run
+    """
+    book_cache = get_cache(book_cache)
+    durations = {}
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {pool.submit(execute_one, path, cache, timeout): path
+                   for path in notebooks}
+        for future in as_completed(futures):
+            try:
+                path, notebook, seconds = future.result()
+            except Exception as exc:
+                print(f"{futures[future]}: FAILED ({type(exc).__name__})")
+                continue
+            # merging is done here in the main process, as the
+            # book cache is a sqlite database that we do not want
+            # to hit concurrently
+            book_cache.cache_notebook_bundle(
+                CacheBundleIn(notebook, str(path.absolute()),
+                              data={"execution_seconds": seconds}),
+                check_validity=False, overwrite=True)
+            durations[path] = seconds
+            print(f"{path}: {seconds:.2f}s")
+    return durations
+
+
+def report(durations, wall_time):
+    total = sum(durations.values())
+    print(f"{'notebook':<50} {'seconds':>8}")
+    for path, seconds in sorted(durations.items(),
+                                key=lambda item: item[1], reverse=True):
+        print(f"{str(path):<50} {seconds:>8.2f}")
+    print(f"{len(durations)} notebooks, {total:.2f}s of execution"
+          f" in {wall_time:.2f}s of wall time")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of workers - default is the number of"
+                             " cores")
+    parser.add_argument("-c", "--cache", default=execute_cells.CACHE,
+                        help="where to store the cell outputs")
+    parser.add_argument("-b", "--book-cache", default=BOOK_CACHE,
+                        help="the jupyter-book cache to fill")
+    parser.add_argument("-t", "--timeout", type=int, default=None,
+                        help="timeout for each cell, in seconds")
+    parser.add_argument("notebooks", nargs="*",
+                        help="default is all the notebooks in the toc")
+    args = parser.parse_args()
+
+    notebooks = ([Path(notebook) for notebook in args.notebooks]
+                 or toc_notebooks())
+    beg = time.perf_counter()
+    durations = execute_book(notebooks, jobs=args.jobs, cache=args.cache,
+                             book_cache=args.book_cache,
+                             timeout=args.timeout)
+    report(durations, time.perf_counter() - beg)
+    if len(durations) != len(notebooks):
+        exit(1)
+
+if __name__ == '__main__':
+    main()
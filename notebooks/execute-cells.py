@@ -0,0 +1,169 @@
+"""
+execute notebooks with a per-cell cache of the outputs
+
+each code cell is cached under a key that depends on
+* its own source,
+* the keys of all the code cells above it,
+* the contents of the data files (e.g. titanic.csv) that it mentions
+
+so editing a markdown cell invalidates nothing, and editing a code cell
+invalidates this cell and all the ones below; when a notebook is entirely
+in the cache, no kernel is started at all
+
+note that the kernel state cannot be restored from the cache, so when
+a cell is invalidated the cells above it still need to be replayed;
+their outputs are not stored again though
+"""
+
+import re
+import json
+import hashlib
+from pathlib import Path
+from argparse import ArgumentParser
+
+import jupytext
+import nbformat
+from nbclient import NotebookClient
+
+CACHE = "_build/.cell-cache"
+OUTPUT = "_build/executed"
+
+# the string literals in a cell, some of which may be data file names
+STRING_LITERAL = re.compile(r"""(['"])([^'"\n]+)\1""")
+
+
+def file_hash(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def data_files(source, directory):
+    """
+    the data files that a cell reads - or at least mentions
+    """
+    names = {name for _, name in STRING_LITERAL.findall(source)}
+    return sorted(name for name in names
+                  if (Path(directory) / name).is_file())
+
+
+def cell_keys(notebook, directory):
+    """
+    one key per cell, None for non-code cells
+    """
+    keys = []
+    upstream = ""
+    for cell in notebook.cells:
+        if cell.cell_type != 'code':
+            keys.append(None)
+            continue
+        hasher = hashlib.sha1()
+        hasher.update(upstream.encode())
+        hasher.update(cell.source.encode())
+        for name in data_files(cell.source, directory):
+            hasher.update(f"{name}:{file_hash(Path(directory) / name)}"
+                          .encode())
+        upstream = hasher.hexdigest()
+        keys.append(upstream)
+    return keys
+
+
+class CellCache:
+    """
+    stores the outputs of a cell in <cache>/<key>.json
+    """
+
+    def __init__(self, cache=CACHE):
+        self.cache = Path(cache)
+
+    def _path(self, key):
+        return self.cache / f"{key}.json"
+
+    def __contains__(self, key):
+        return self._path(key).exists()
+
+    def load(self, key, cell):
+        with self._path(key).open() as reader:
+            stored = json.load(reader)
+        cell.outputs = [nbformat.from_dict(output)
+                        for output in stored['outputs']]
+        cell.execution_count = stored['execution_count']
+
+    def store(self, key, cell):
+        self.cache.mkdir(parents=True, exist_ok=True)
+        with self._path(key).open('w') as writer:
+            json.dump(dict(outputs=cell.outputs,
+                           execution_count=cell.execution_count), writer)
+
+
+def execute(path, cache=CACHE, timeout=None, verbose=True):
+    """
+    execute the notebook at path (in any format that jupytext can read)
+    and return the executed notebook
+
+    returns a tuple (notebook, nb_cached, nb_executed)
+    """
+    path = Path(path)
+    directory = path.parent
+    notebook = jupytext.read(path)
+    cache = CellCache(cache)
+    keys = cell_keys(notebook, directory)
+
+    code_cells = [index for index, key in enumerate(keys) if key]
+    first_miss = next((index for index in code_cells
+                       if keys[index] not in cache), None)
+    # fill in everything we have
+    for index in code_cells:
+        if first_miss is not None and index >= first_miss:
+            break
+        cache.load(keys[index], notebook.cells[index])
+    if first_miss is None:
+        if verbose:
+            print(f"{path}: {len(code_cells)} cells from cache")
+        return notebook, len(code_cells), 0
+
+    kernel_name = (notebook.metadata
+                   .get('kernelspec', {}).get('name', 'python3'))
+    # no timestamps in the cells metadata: jupyter-cache hashes it,
+    # and the executed notebook would never match the source one
+    client = NotebookClient(
+        notebook, timeout=timeout, kernel_name=kernel_name,
+        record_timing=False,
+        resources={'metadata': {'path': str(directory)}})
+    nb_executed = 0
+    with client.setup_kernel():
+        for index in code_cells:
+            cell = notebook.cells[index]
+            if index < first_miss:
+                # replay to rebuild the kernel state, but keep cached outputs
+                outputs, count = cell.outputs, cell.execution_count
+                client.execute_cell(cell, index)
+                cell.outputs, cell.execution_count = outputs, count
+                continue
+            client.execute_cell(cell, index)
+            cache.store(keys[index], cell)
+            nb_executed += 1
+    nb_cached = len(code_cells) - nb_executed
+    if verbose:
+        print(f"{path}: {nb_cached} cells from cache, "
+              f"{nb_executed} executed")
+    return notebook, nb_cached, nb_executed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-c", "--cache", default=CACHE,
+                        help="where to store the cell outputs")
+    parser.add_argument("-o", "--output", default=OUTPUT,
+                        help="where to write the executed .ipynb notebooks")
+    parser.add_argument("-t", "--timeout", type=int, default=None,
+                        help="timeout for each cell, in seconds")
+    parser.add_argument("notebooks", nargs="+")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    for path in args.notebooks:
+        notebook, *_ = execute(path, cache=args.cache, timeout=args.timeout)
+        nbformat.write(notebook, output / f"{Path(path).stem}.ipynb")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+évaluer une suite d'opérations vectorisées sans allouer un tableau par étape
+cf. pipeline() dans 1-05-numpy-indexing-slicing, et
+trigo_function_developpee() dans 1-04-numpy-vectorization
+
+on écrit la fonction normalement, sous sa forme compacte
+
+    def trigo(x):
+        return 4*np.exp(np.cos(x))**2
+
+et Pipeline(trigo) l'appelle une fois sur un paramètre symbolique,
+pour en extraire la suite des ufuncs; à l'évaluation, chaque étape
+écrit avec out= dans le tableau d'un opérande dont on n'a plus besoin,
+ce qui revient à écrire trigo_function_developpee_out à la main
+
+    >>> trigo = Pipeline(trigo)
+    >>> trigo(x)              # comme trigo(x), avec 1 tableau au lieu de 4
+    >>> trigo.allocated, trigo.naive
+
+sur les grands tableaux, trigo.blocked(x) découpe x en morceaux qui
+tiennent dans le cache L2, et calcule toute la chaîne sur chaque morceau,
+dans plusieurs threads (les ufuncs relâchent le GIL)
+"""
+
+import os
+import math
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+import numpy as np
+
+
+def l2_size(default=256 * 1024):
+    """
+    la taille du cache L2 en octets, si on arrive à la trouver
+    """
+    try:
+        for index in Path("/sys/devices/system/cpu/cpu0/cache").iterdir():
+            if (index / "level").read_text().strip() == "2":
+                size = (index / "size").read_text().strip()
+                units = {'K': 2**10, 'M': 2**20}
+                return int(size.rstrip('KM')) * units.get(size[-1], 1)
+    except (OSError, ValueError):
+        pass
+    return default
+
+
+class Expr(NDArrayOperatorsMixin):
+    """
+    un noeud du calcul: une ufunc appliquée à des opérandes, qui
+    sont d'autres Expr ou des constantes; sans ufunc, c'est le paramètre
+
+    grâce à NDArrayOperatorsMixin, les opérateurs (+, *, **...)
+    passent eux aussi par __array_ufunc__
+    """
+    def __init__(self, ufunc=None, inputs=()):
+        self.ufunc = ufunc
+        self.inputs = inputs
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs or ufunc.nout != 1:
+            return NotImplemented
+        return Expr(ufunc, inputs)
+
+    def __repr__(self):
+        if self.ufunc is None:
+            return "x"
+        return f"{self.ufunc.__name__}({', '.join(map(repr, self.inputs))})"
+
+
+class Pipeline:
+    """
+    function(x) compilée en une suite d'étapes, que l'on peut ensuite
+    appeler sur des tableaux; après chaque appel, allocated donne le nombre
+    d'octets alloués, et naive celui qu'aurait alloué function(x)
+    """
+    def __init__(self, function):
+        self.parameter = Expr()
+        self.output = function(self.parameter)
+        # si function rend x tel quel, il n'y a aucune étape à compiler
+        if not isinstance(self.output, Expr) or self.output.ufunc is None:
+            raise TypeError(f"{function.__name__} does not use numpy ufuncs")
+        self.steps = self._schedule()
+        self.allocated = self.naive = None
+
+    def _schedule(self):
+        """
+        les noeuds dans l'ordre du calcul (chacun une seule fois,
+        même s'il est utilisé plusieurs fois)
+        """
+        steps, seen = [], set()
+        def visit(node):
+            if not isinstance(node, Expr) or id(node) in seen:
+                return
+            seen.add(id(node))
+            for operand in node.inputs:
+                visit(operand)
+            if node.ufunc is not None:
+                steps.append(node)
+        visit(self.output)
+        return steps
+
+    def compile(self, shape, dtype):
+        """
+        attribue un tableau (un 'registre') au résultat de chaque étape,
+        pour un paramètre de cette forme et de ce type, en réutilisant
+        les registres des opérandes dont on n'a plus besoin
+
+        retourne (program, registers, naive), où program est une liste de
+        (ufunc, opérandes, registre), un opérande étant soit None pour
+        le paramètre, soit ('reg', i), soit ('const', valeur)
+        et registers la liste des (forme, type) des registres
+        """
+        # combien de fois chaque noeud sert encore
+        uses = {}
+        for step in self.steps:
+            for operand in step.inputs:
+                if isinstance(operand, Expr):
+                    uses[id(operand)] = uses.get(id(operand), 0) + 1
+        # le registre de chaque noeud, et les registres libres
+        where = {id(self.parameter): None}
+        registers, free = [], []
+        program = []
+        naive = 0
+        for step in self.steps:
+            operands = []
+            for operand in step.inputs:
+                if not isinstance(operand, Expr):
+                    operands.append(('const', operand))
+                elif where[id(operand)] is None:
+                    operands.append(None)
+                else:
+                    operands.append(('reg', where[id(operand)]))
+            # la forme et le type du résultat, sans rien calculer de gros;
+            # une constante tableau est remplacée par un tableau de même
+            # type, avec des 1 comme dimensions, qui se broadcaste avec tout
+            probes = [np.empty(0, dtype=dtype) if operand is None else
+                      np.empty(0, dtype=registers[operand[1]][1])
+                      if operand[0] == 'reg' else
+                      np.empty((1,) * np.ndim(operand[1]),
+                               dtype=np.asarray(operand[1]).dtype)
+                      if np.ndim(operand[1]) else operand[1]
+                      for operand in operands]
+            step_dtype = step.ufunc(*probes).dtype
+            step_shape = np.broadcast_shapes(*(
+                shape if operand is None else
+                registers[operand[1]][0] if operand[0] == 'reg' else
+                np.shape(operand[1])
+                for operand in operands))
+            naive += step_dtype.itemsize * math.prod(step_shape)
+            # les opérandes qui meurent ici libèrent leur registre;
+            # écrire en place dans un opérande est sans risque
+            # pour une ufunc, qui travaille élément par élément
+            for operand in step.inputs:
+                if isinstance(operand, Expr) and operand is not self.parameter:
+                    uses[id(operand)] -= 1
+                    if uses[id(operand)] == 0:
+                        free.append(where[id(operand)])
+            reusable = [register for register in free
+                        if registers[register] == (step_shape, step_dtype)]
+            if reusable:
+                register = reusable[0]
+                free.remove(register)
+            else:
+                register = len(registers)
+                registers.append((step_shape, step_dtype))
+            where[id(step)] = register
+            program.append((step.ufunc, operands, register))
+        return program, registers, naive
+
+    @staticmethod
+    def run(program, x, buffers, out=None):
+        """
+        exécute un programme produit par compile(), avec ces buffers
+        pour les registres; si out est fourni, la dernière étape y écrit
+        """
+        for index, (ufunc, operands, register) in enumerate(program):
+            values = [x if operand is None else
+                      buffers[operand[1]] if operand[0] == 'reg' else
+                      operand[1]
+                      for operand in operands]
+            target = (out if out is not None and index == len(program) - 1
+                      else buffers[register])
+            ufunc(*values, out=target)
+        return target
+
+    def __call__(self, x, out=None):
+        x = np.asarray(x)
+        program, registers, naive = self.compile(x.shape, x.dtype)
+        buffers = [np.empty(shape, dtype=dtype) for shape, dtype in registers]
+        self.allocated = sum(buffer.nbytes for buffer in buffers)
+        self.naive = naive
+        return self.run(program, x, buffers, out)
+
+    def blocked(self, x, chunk=None, jobs=None):
+        """
+        même résultat que self(x), mais calculé par morceaux de chunk
+        éléments (par défaut, de quoi faire tenir les registres dans
+        le cache L2), sur jobs threads
+
+        seul le résultat est alloué en entier; chaque thread a ses
+        registres, de la taille d'un morceau, réutilisés d'un morceau à
+        l'autre; les constantes doivent donc être des scalaires
+        """
+        x = np.asarray(x)
+        flat = x.reshape(-1)
+        if chunk is None:
+            # le morceau de x, celui du résultat, et tous les registres;
+            # leur nombre ne dépend pas de la taille, un élément suffit
+            _, registers, _ = self.compile((1,), x.dtype)
+            itemsize = max([x.itemsize] + [np.dtype(dtype).itemsize
+                                           for _, dtype in registers])
+            chunk = max(1024, l2_size() // ((len(registers) + 2) * itemsize))
+        chunk = min(chunk, max(len(flat), 1))
+        program, registers, _ = self.compile((chunk,), x.dtype)
+        result = np.empty(x.shape, dtype=registers[program[-1][2]][1])
+        flat_result = result.reshape(-1)
+        local = threading.local()
+        def run(beg):
+            if not hasattr(local, 'buffers'):
+                local.buffers = [np.empty(shape, dtype=dtype)
+                                 for shape, dtype in registers]
+            end = min(beg + chunk, len(flat))
+            # le dernier morceau est plus petit
+            buffers = (local.buffers if end - beg == chunk else
+                       [buffer[:end-beg] for buffer in local.buffers])
+            self.run(program, flat[beg:end], buffers, flat_result[beg:end])
+        with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+            # list() pour que les exceptions remontent
+            list(pool.map(run, range(0, len(flat), chunk)))
+        return result
+
+    def __repr__(self):
+        return f"Pipeline({self.output!r})"
+
+
+########## les exemples des notebooks
+
+def trigo_function_compact(x):
+    return 4*np.exp(np.cos(x))**2
+
+
+def pipeline(array):
+    array2a = np.sin(array)
+    array2b = np.cos(array)
+    array3 = np.exp(array2a + array2b)
+    array4 = np.log(array3+1)
+    return array4
+
+
+if __name__ == '__main__':
+    X = np.linspace(0, 2*np.pi, 1000)
+    for function in trigo_function_compact, pipeline:
+        fused = Pipeline(function)
+        assert np.allclose(fused(X), function(X))
+        assert np.allclose(fused.blocked(X, chunk=100), function(X))
+        print(f"{function.__name__}: {fused.allocated} bytes"
+              f" instead of {fused.naive}")
@@ -0,0 +1,95 @@
+"""
+passer d'un indice 'à plat' à des coordonnées, et inversement
+cf. l'exercice unravel_index du notebook 1-07-numpy-aggregate
+
+la version du notebook traite un seul indice, et recalcule un
+np.prod à chaque rang; ici les fonctions prennent des tableaux
+d'indices entiers, et les pas ne sont calculés qu'une fois par forme
+
+c'est un corrigé de l'exercice (question 1: "proposez le code de la
+fonction np.unravel_index"), étendu aux tableaux d'indices et à
+l'ordre 'F', pas un raccourci: les fonctions de numpy, écrites en C,
+restent plus rapides dans tous les cas, cf. benchmarks.py -k ravel;
+pour de vrais calculs, utilisez donc np.unravel_index et
+np.ravel_multi_index
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=64)
+def strides(shape, order='C'):
+    """
+    le nombre d'éléments qu'on saute en avançant de 1 sur chaque axe
+    (ce sont les strides de numpy, mais en éléments et pas en octets)
+    """
+    if order not in ('C', 'F'):
+        raise ValueError(f"order must be 'C' or 'F', not {order}")
+    dims = shape if order == 'F' else shape[::-1]
+    result = []
+    size = 1
+    for dim in dims:
+        result.append(size)
+        size *= dim
+    return tuple(result if order == 'F' else result[::-1])
+
+
+def unravel_index(indices, shape, order='C'):
+    """
+    comme np.unravel_index: retourne un tuple de tableaux, un par axe,
+    de la même forme que indices
+    """
+    shape = tuple(int(dim) for dim in shape)
+    steps = strides(shape, order)
+    size = math.prod(shape)
+    if np.ndim(indices) == 0:
+        # pour un seul indice, on évite de passer par des tableaux
+        index = int(indices)
+        if not 0 <= index < size:
+            raise ValueError(f"index out of bounds for shape {shape}")
+        result = [0] * len(shape)
+        axes = (range(len(shape)) if order == 'C'
+                else reversed(range(len(shape))))
+        for axis in axes:
+            result[axis], index = divmod(index, steps[axis])
+        return tuple(result)
+    indices = np.asarray(indices, dtype=np.intp)
+    if indices.size and (indices.min() < 0 or indices.max() >= size):
+        raise ValueError(f"index out of bounds for shape {shape}")
+    # on traite les axes par pas décroissant, et on garde le reste
+    axes = range(len(shape)) if order == 'C' else reversed(range(len(shape)))
+    result = [None] * len(shape)
+    rest = indices
+    for axis in axes:
+        result[axis], rest = np.divmod(rest, steps[axis])
+    return tuple(result)
+
+
+def ravel_multi_index(multi_index, shape, order='C'):
+    """
+    comme np.ravel_multi_index: l'inverse de unravel_index
+    """
+    shape = tuple(int(dim) for dim in shape)
+    if len(multi_index) != len(shape):
+        raise ValueError(f"need {len(shape)} coordinates")
+    steps = strides(shape, order)
+    if all(np.ndim(coords) == 0 for coords in multi_index):
+        # même raccourci que dans unravel_index
+        result = 0
+        for coords, dim, step in zip(multi_index, shape, steps):
+            if not 0 <= coords < dim:
+                raise ValueError(f"index out of bounds for shape {shape}")
+            result += int(coords) * step
+        return result
+    multi_index = [np.asarray(coords, dtype=np.intp) for coords in multi_index]
+    result = np.zeros(np.broadcast_shapes(*(coords.shape
+                                            for coords in multi_index)),
+                      dtype=np.intp)
+    for coords, dim, step in zip(multi_index, shape, steps):
+        if coords.size and (coords.min() < 0 or coords.max() >= dim):
+            raise ValueError(f"index out of bounds for shape {shape}")
+        result += coords * step
+    return result[()] if result.ndim == 0 else result
@@ -0,0 +1,119 @@
+"""
+assembler des milliers de tuiles en une seule image, sans boucle python
+cf. le patchwork du TP image-2 (media/patchwork-all.jpg), et
+colormap[pattern] dans 1-14-numpy-optional-indexing
+
+l'image finale, de forme (rows * height, cols * width, 3), se voit
+aussi comme un tableau (rows, height, cols, width, 3); dans cette vue,
+chaque tuile (i, j) est le bloc [i, :, j, :], et on remplit toutes
+les tuiles d'un coup par broadcasting, ou une rangée à la fois
+par fancy indexing
+
+    >>> mosaic(colors, (rows, cols), tile=(10, 10))    # des aplats
+    >>> mosaic(images, (rows, cols))                   # des imagettes
+    >>> mosaic(images, indices)        # indices: (rows, cols) dans images
+"""
+
+import time
+
+import numpy as np
+
+
+def blocks(out, rows, cols):
+    """
+    la vue (rows, cols, height, width, ...) de l'image out, où [i, j]
+    est la tuile (i, j); écrire dedans écrit dans out
+    """
+    height, width = out.shape[0] // rows, out.shape[1] // cols
+    if (height * rows, width * cols) != out.shape[:2]:
+        raise ValueError(f"{out.shape[:2]} is not a {rows}x{cols} grid")
+    view = out.reshape(rows, height, cols, width, *out.shape[2:])
+    return view.swapaxes(1, 2)
+
+
+def mosaic(tiles, grid, tile=None, out=None):
+    """
+    tiles est soit un tableau de couleurs (n, 3), et il faut alors
+    préciser la taille des tuiles tile=(height, width), soit un tableau
+    d'imagettes (n, height, width, 3)
+
+    grid est soit la forme (rows, cols) de la grille, et les tuiles sont
+    prises dans l'ordre, soit un tableau (rows, cols) d'indices dans tiles
+
+    out est un buffer à réutiliser, sinon le résultat est alloué
+    """
+    tiles = np.asarray(tiles)
+    if isinstance(grid, tuple):
+        rows, cols = grid
+        if len(tiles) != rows * cols:
+            raise ValueError(f"need {rows * cols} tiles, got {len(tiles)}")
+        indices = None
+    else:
+        indices = np.asarray(grid)
+        rows, cols = indices.shape
+        if indices.size and (indices.min() < 0
+                             or indices.max() >= len(tiles)):
+            raise IndexError("tile indices out of range")
+    colors = tile is not None
+    if colors:
+        height, width = tile
+        pixel = tiles.shape[1:]
+    else:
+        height, width = tiles.shape[1:3]
+        pixel = tiles.shape[3:]
+    shape = (rows * height, cols * width, *pixel)
+    if out is None:
+        out = np.empty(shape, dtype=tiles.dtype)
+    elif out.shape != shape:
+        raise ValueError(f"out must have shape {shape}")
+    if colors:
+        # une couleur par tuile, petit tableau (rows, cols, 3)
+        grid_colors = (tiles.reshape(rows, cols, *pixel) if indices is None
+                       else tiles[indices])
+        # on remplit la première ligne de pixels de chaque rangée de
+        # tuiles par broadcasting, puis on la recopie sur les suivantes;
+        # c'est bien plus rapide que de broadcaster directement dans view,
+        # où les boucles internes de numpy seraient minuscules
+        lines = out.reshape(rows, height, cols, width, *pixel)
+        lines[:, 0] = grid_colors[:, :, np.newaxis]
+        lines[:, 1:] = lines[:, :1]
+    elif indices is None:
+        blocks(out, rows, cols)[...] = tiles.reshape(
+            rows, cols, height, width, *pixel)
+    else:
+        # np.take(..., out=view) ne sait pas écrire dans une vue non
+        # contiguë, et passerait par un temporaire de la taille de out;
+        # rangée par rangée, le temporaire n'est qu'une rangée de tuiles
+        lines = out.reshape(rows, height, cols, width, *pixel)
+        for i in range(rows):
+            lines[i] = tiles[indices[i]].swapaxes(0, 1)
+    return out
+
+
+def throughput(nb_tiles=10_000, tile=(16, 16), images=True, repeat=5):
+    """
+    combien de tuiles par seconde on assemble
+    """
+    side = int(nb_tiles ** 0.5)
+    rng = np.random.default_rng(0)
+    if images:
+        tiles = rng.integers(0, 256, (side * side, *tile, 3), dtype=np.uint8)
+        kwargs = {}
+    else:
+        tiles = rng.integers(0, 256, (side * side, 3), dtype=np.uint8)
+        kwargs = dict(tile=tile)
+    out = mosaic(tiles, (side, side), **kwargs)
+    best = float('inf')
+    for _ in range(repeat):
+        beg = time.perf_counter()
+        mosaic(tiles, (side, side), out=out, **kwargs)
+        best = min(best, time.perf_counter() - beg)
+    return side * side / best
+
+
+if __name__ == '__main__':
+    for images in False, True:
+        for nb_tiles in 100, 10_000, 40_000:
+            kind = "images" if images else "colors"
+            print(f"{nb_tiles:>6} {kind:<6}"
+                  f" {throughput(nb_tiles, images=images):12,.0f} tiles/s")
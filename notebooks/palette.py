@@ -0,0 +1,231 @@
+"""
+dessiner une image à partir d'une palette et d'un tableau d'indices
+cf. colormap[pattern] dans 1-14-numpy-optional-indexing
+
+colormap[pattern] alloue à chaque fois un tableau neuf de forme (h, w, 3),
+en int64 si la palette est en int64; ici la palette est en uint8, la
+sortie est un buffer réutilisé d'un appel à l'autre, et on travaille par
+bandes de lignes, de façon à ce que les indices puissent être un memmap
+(np.load(..., mmap_mode='r')) sans jamais être chargés en entier
+
+    >>> renderer = Renderer(colormap)
+    >>> image = renderer.render(pattern)     # comme colormap[pattern]
+    >>> renderer.render_file("pattern.npy", "image.npy")    # par bandes
+
+on y trouve aussi un Quantizer, qui ramène chaque pixel d'une image
+à la plus proche des couleurs nommées de rgb-codes.txt
+
+    >>> quantizer = Quantizer()
+    >>> indices = quantizer.quantize(image)      # des indices dans la palette
+    >>> Renderer(quantizer.colors).render(indices)
+"""
+
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+RGB_CODES = Path(__file__).parent / "rgb-codes.txt"
+
+# ce qu'on s'autorise à allouer pour une bande
+BAND_BUDGET = 2**24
+
+
+class Renderer:
+    """
+    palette est un tableau (k, 3) - ou (k, 4) - de couleurs entre 0 et 255
+    """
+    def __init__(self, palette, budget=BAND_BUDGET):
+        palette = np.asarray(palette)
+        if palette.ndim != 2 or palette.min() < 0 or palette.max() > 255:
+            raise ValueError("palette must be a (k, channels) array of bytes")
+        self.palette = palette.astype(np.uint8)
+        self.budget = budget
+        self.buffer = None
+
+    def band_height(self, width):
+        """
+        combien de lignes par bande: np.take convertit la bande
+        d'indices en intp, et écrit channels octets par pixel
+        """
+        per_row = width * (np.dtype(np.intp).itemsize + self.palette.shape[1])
+        return max(1, self.budget // per_row)
+
+    def render(self, indices, out=None):
+        """
+        comme palette[indices], mais en uint8 et par bandes
+
+        sans out, le résultat est écrit dans un buffer qui est réutilisé
+        à l'appel suivant (s'il a la même forme)
+        """
+        height, width = indices.shape
+        shape = (height, width, self.palette.shape[1])
+        if out is None:
+            if self.buffer is None or self.buffer.shape != shape:
+                self.buffer = np.empty(shape, dtype=np.uint8)
+            out = self.buffer
+        if out.shape != shape or out.dtype != np.uint8:
+            raise ValueError(f"out must be a {shape} uint8 array")
+        step = self.band_height(width)
+        for beg in range(0, height, step):
+            end = min(beg + step, height)
+            self._render_band(indices[beg:end], out[beg:end], beg)
+        return out
+
+    def _render_band(self, band, out, beg=0):
+        if band.size and (band.min() < 0 or band.max() >= len(self.palette)):
+            raise IndexError(f"indices out of the palette,"
+                             f" in rows {beg}:{beg+len(band)}")
+        # mode='clip' évite que np.take passe par un buffer
+        # intermédiaire; les indices viennent d'être vérifiés
+        np.take(self.palette, band, axis=0, out=out, mode='clip')
+
+    def render_file(self, indices, output):
+        """
+        lit les indices dans un fichier .npy, et écrit l'image dans
+        un autre, bande par bande: la mémoire utilisée ne dépend pas
+        de la taille de l'image
+
+        on lit et on écrit par des read/write plutôt qu'avec des memmaps,
+        dont les pages resteraient comptées dans la mémoire du processus
+        """
+        with open(indices, 'rb') as reader, open(output, 'wb') as writer:
+            if np.lib.format.read_magic(reader) == (1, 0):
+                read_header = np.lib.format.read_array_header_1_0
+            else:
+                read_header = np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(reader)
+            if len(shape) != 2 or fortran_order:
+                raise ValueError(f"{indices}: need a 2-D C-ordered array")
+            height, width = shape
+            channels = self.palette.shape[1]
+            np.lib.format.write_array_header_2_0(writer, dict(
+                descr=np.lib.format.dtype_to_descr(np.dtype(np.uint8)),
+                fortran_order=False, shape=(height, width, channels)))
+            step = min(self.band_height(width), height)
+            # les deux buffers sont réutilisés pour toutes les bandes
+            bands = np.empty((step, width), dtype=dtype)
+            buffer = np.empty((step, width, channels), dtype=np.uint8)
+            for beg in range(0, height, step):
+                rows = min(step, height - beg)
+                band = bands[:rows]
+                if reader.readinto(band) != band.nbytes:
+                    raise ValueError(f"{indices}: truncated file")
+                out = buffer[:rows]
+                self._render_band(band, out, beg)
+                writer.write(out)
+        return np.load(output, mmap_mode='r')
+
+
+@lru_cache
+def load_colors(filename=RGB_CODES):
+    """
+    les couleurs nommées, comme dans rgb-codes.txt: une par ligne,
+    le nom puis les 3 composantes
+
+    retourne le tuple des noms, et le tableau (k, 3) en uint8
+    """
+    names, colors = [], []
+    with open(filename) as reader:
+        for line in reader:
+            if not line.strip():
+                continue
+            name, *rgb = line.split()
+            names.append(name)
+            colors.append([int(x) for x in rgb])
+    colors = np.array(colors, dtype=np.uint8)
+    # partagé par tous les appels, on le protège
+    colors.flags.writeable = False
+    return tuple(names), colors
+
+
+class Quantizer:
+    """
+    associe à chaque couleur RGB la plus proche (au sens de la distance
+    euclidienne) parmi colors - par défaut les couleurs de rgb-codes.txt
+
+    on précalcule pour cela une table de 256**3 indices (16 Mo), après
+    quoi chaque pixel ne coûte plus qu'un accès dans la table
+    """
+    def __init__(self, colors=None, block=16):
+        if colors is None:
+            self.names, colors = load_colors()
+        else:
+            self.names = None
+        self.colors = np.asarray(colors, dtype=np.uint8)
+        if len(self.colors) > 256:
+            raise ValueError("at most 256 colors")
+        self.table = self._table(block)
+
+    def _table(self, block):
+        """
+        calculer 256**3 x k distances serait trop long; on découpe
+        le cube RGB en blocs de block**3, et pour chaque bloc on ne garde
+        que les couleurs qui peuvent être la plus proche d'un de ses points:
+        celles dont la distance minimale au bloc ne dépasse pas la plus
+        petite des distances maximales
+        """
+        colors = self.colors.astype(np.int32)
+        nb_blocks = 256 // block
+        # les coins 'bas' des blocs, (nb_blocks**3, 3)
+        lows = np.indices((nb_blocks,) * 3).reshape(3, -1).T * block
+        highs = lows + block - 1
+        # (blocs, couleurs, 3)
+        below = lows[:, np.newaxis, :] - colors
+        above = colors - highs[:, np.newaxis, :]
+        dmin = (np.maximum(0, np.maximum(below, above)) ** 2).sum(axis=2)
+        dmax = (np.maximum(np.abs(below), np.abs(above)) ** 2).sum(axis=2)
+        candidates = dmin <= dmax.min(axis=1, keepdims=True)
+
+        table = np.empty((256, 256, 256), dtype=np.uint8)
+        offsets = np.indices((block,) * 3).transpose(1, 2, 3, 0)
+        for low, keep in zip(lows, candidates):
+            (indices,) = np.nonzero(keep)
+            r, g, b = low
+            view = table[r:r+block, g:g+block, b:b+block]
+            if len(indices) == 1:
+                view[...] = indices[0]
+                continue
+            points = low + offsets
+            distances = ((points[..., np.newaxis, :] - colors[indices]) ** 2
+                         ).sum(axis=-1)
+            # les indices sont croissants: en cas d'égalité on garde
+            # le premier, comme le ferait argmin sur toutes les couleurs
+            view[...] = indices[distances.argmin(axis=-1)]
+        return table
+
+    def quantize(self, image, out=None, tile=2**20):
+        """
+        pour chaque pixel de image (h, w, 3 ou 4), l'indice de la couleur
+        la plus proche; le calcul se fait par morceaux de tile pixels
+        """
+        image = np.asarray(image)
+        if image.ndim != 3 or image.shape[2] not in (3, 4):
+            raise ValueError("image must be a (h, w, 3 or 4) array")
+        # des octets: pas de flottants entre 0 et 1 comme ceux que rend
+        # plt.imread pour un png, ni d'entiers que np.take tronquerait
+        if image.dtype.kind not in 'ui':
+            raise ValueError(f"image must hold integers between 0 and 255,"
+                             f" not {image.dtype}; for floats between 0 and"
+                             f" 1, use (image * 255).round().astype(np.uint8)")
+        if image.dtype != np.uint8 and image.size and (
+                image.min() < 0 or image.max() > 255):
+            raise ValueError("image values must be between 0 and 255")
+        height, width = image.shape[:2]
+        if out is None:
+            out = np.empty((height, width), dtype=np.uint8)
+        pixels = image.reshape(-1, image.shape[2])
+        flat = out.reshape(-1)
+        for beg in range(0, len(pixels), tile):
+            chunk = pixels[beg:beg+tile]
+            # un seul indice dans la table, calculé en place
+            index = chunk[:, 0].astype(np.intp)
+            index <<= 8
+            index |= chunk[:, 1]
+            index <<= 8
+            index |= chunk[:, 2]
+            np.take(self.table, index, out=flat[beg:beg+tile], mode='clip')
+        return out
+
+    def name(self, index):
+        return self.names[index]
@@ -0,0 +1,146 @@
+"""
+des motifs (damiers, escaliers) sans allouer de matrice
+cf. super_checkers et les escaliers dans 1-05-numpy-indexing-slicing
+
+ces motifs sont tous de la forme f(ligne, colonne) = op(a[ligne], b[colonne]),
+il suffit donc de garder les deux vecteurs a et b, soit O(n+m) en mémoire
+au lieu de O(n.m); la matrice n'est calculée que quand on en a besoin
+
+    >>> mask = checkers(4000, 3000, block=100)
+    >>> mask.nbytes                    # 7000 octets, pas 12 millions
+    >>> image[mask] = 0                # numpy la calcule à ce moment-là
+    >>> mask.where(image, 255, out=image)   # par bandes, sans la calculer
+"""
+
+import numpy as np
+
+
+class Pattern:
+    """
+    la matrice ufunc(column[i], row[j]), de forme (len(column), len(row))
+
+    ce n'est pas un tableau numpy, mais elle peut s'utiliser comme tel
+    (np.asarray, masque, np.where...), elle est alors calculée en entier;
+    slicer un Pattern (avec des slices) donne encore un Pattern
+    """
+    def __init__(self, column, row, ufunc):
+        self.column = np.asarray(column)
+        self.row = np.asarray(row)
+        self.ufunc = ufunc
+        self.shape = (len(self.column), len(self.row))
+        # le type du résultat, sur des tableaux vides
+        self.dtype = ufunc(self.column[:0], self.row[:0]).dtype
+
+    ndim = 2
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        """
+        ce qui est vraiment stocké
+        """
+        return self.column.nbytes + self.row.nbytes
+
+    def views(self):
+        """
+        les deux opérandes, sous forme de vues de la forme du motif,
+        sans copie (leurs strides valent 0) et en lecture seule
+        """
+        return (np.broadcast_to(self.column[:, np.newaxis], self.shape),
+                np.broadcast_to(self.row[np.newaxis, :], self.shape))
+
+    def materialize(self, out=None):
+        """
+        calcule la matrice, dans out si fourni
+        """
+        return self.ufunc(self.column[:, np.newaxis], self.row, out=out)
+
+    def __array__(self, dtype=None, copy=None):
+        result = self.materialize()
+        return result if dtype is None else result.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) <= 2 and all(isinstance(k, slice) for k in key):
+            rows, columns = (*key, slice(None))[:2]
+            return Pattern(self.column[rows], self.row[columns], self.ufunc)
+        return self.materialize()[key]
+
+    def bands(self, height=256):
+        """
+        la matrice par bandes de height lignes: des couples (slice, bande)
+        la bande est toujours calculée dans le même buffer, il faut
+        donc s'en servir avant de passer à la suivante
+        """
+        buffer = np.empty((min(height, self.shape[0]), self.shape[1]),
+                          dtype=self.dtype)
+        for beg in range(0, self.shape[0], height):
+            rows = slice(beg, min(beg + height, self.shape[0]))
+            band = buffer[:rows.stop - rows.start]
+            self.ufunc(self.column[rows, np.newaxis], self.row, out=band)
+            yield rows, band
+
+    def where(self, x, y, out=None, height=256):
+        """
+        comme np.where(self, x, y), mais calculé par bandes de lignes;
+        x et y sont des scalaires, ou des tableaux dont les deux premières
+        dimensions sont celles du motif (une image RGB par exemple);
+        out peut être x ou y, pour modifier une image en place
+        """
+        x, y = np.asarray(x), np.asarray(y)
+        if out is None:
+            shape = np.broadcast_shapes(self.shape, x.shape[:2], y.shape[:2])
+            shape += max(x.shape[2:], y.shape[2:], key=len)
+            out = np.empty(shape, dtype=np.result_type(x, y))
+        # les scalaires prennent le type du résultat, comme avec np.where
+        x, y = (array.astype(out.dtype) if array.ndim < 2 else array
+                for array in (x, y))
+        # les dimensions en plus (les couleurs) viennent à droite
+        extra = (np.newaxis,) * (out.ndim - 2)
+        def part(array, rows):
+            return array if array.ndim < 2 else array[rows]
+        for rows, band in self.bands(height):
+            mask = band[(..., *extra)]
+            if np.may_share_memory(out, x):
+                np.copyto(out[rows], part(y, rows), where=~mask)
+            else:
+                if not np.may_share_memory(out, y):
+                    np.copyto(out[rows], part(y, rows))
+                np.copyto(out[rows], part(x, rows), where=mask)
+        return out
+
+    def __repr__(self):
+        return (f"Pattern({self.ufunc.__name__}, shape={self.shape},"
+                f" dtype={self.dtype})")
+
+
+def checkers(height, width=None, block=1, corner=False):
+    """
+    un damier de blocs de block x block cases, qui vaut corner en (0, 0)
+    """
+    if width is None:
+        width = height
+    column = (np.arange(height) // block) % 2 == 1
+    row = (np.arange(width) // block) % 2 == 1
+    return Pattern(column, row, np.equal if corner else np.not_equal)
+
+
+def super_checkers(n, k):
+    """
+    la variante du notebook: n x n blocs de k x k, le premier vaut 0
+    """
+    return checkers(n * k, block=k)
+
+
+def stairs(n):
+    """
+    l'escalier du notebook: de taille 2n+1, 0 aux coins, 2n au centre
+    """
+    steps = np.arange(2*n + 1)
+    # la distance au bord le plus proche
+    steps = np.minimum(steps, 2*n - steps)
+    return Pattern(steps, steps, np.add)
@@ -0,0 +1,233 @@
+"""
+run all the notebooks of the book, and measure each code cell for
+* wall time and CPU time (of the kernel process)
+* peak RSS (reset before each cell on linux; otherwise this is the
+  peak since the kernel started, so only the increases are meaningful)
+* peak of the memory allocated by python, as seen by tracemalloc
+
+the results for the whole book are ranked in a JSON file, and in
+an HTML page where the table can be sorted by clicking a column header
+
+notebooks are run one after the other, so that the measurements
+do not interfere with each other; also remember that tracemalloc
+slows things down, use --no-tracemalloc for more accurate timings
+"""
+
+import json
+import html
+import importlib
+from pathlib import Path
+from argparse import ArgumentParser
+
+import jupytext
+import nbformat
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError
+
+execute_book = importlib.import_module("execute-book")
+
+JSON = "_build/profile.json"
+HTML = "_build/profile.html"
+
+# this runs once in the kernel, and registers IPython callbacks around
+# each cell, so that the measures are taken within the cell's own
+# execution, without the round-trips of the extra requests; the cells
+# that we run silently (store_history=False) are not measured
+SETUP = """
+import sys as __sys, json as __json, time as __time, resource as __resource
+import tracemalloc as __tracemalloc
+
+def __peak_rss():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # in kilobytes on linux, but in bytes on macOS
+    maxrss = __resource.getrusage(__resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if __sys.platform == 'darwin' else maxrss * 1024
+
+__measures = None
+
+def __profile_before(info):
+    global __start
+    if not info.store_history:
+        return
+    if __tracemalloc.is_tracing():
+        __tracemalloc.reset_peak()
+    try:
+        # resets VmHWM to the current RSS
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+    __start = __time.perf_counter(), __time.process_time()
+
+def __profile_after(result):
+    global __measures
+    if not result.info.store_history:
+        return
+    wall, cpu = __time.perf_counter(), __time.process_time()
+    __measures = dict(
+        wall=wall - __start[0],
+        cpu=cpu - __start[1],
+        peak_rss=__peak_rss(),
+        tracemalloc_peak=(__tracemalloc.get_traced_memory()[1]
+                          if __tracemalloc.is_tracing() else None),
+    )
+
+def __profile_report():
+    global __measures
+    print(__json.dumps(__measures))
+    __measures = None
+
+if {trace}:
+    __tracemalloc.start()
+get_ipython().events.register('pre_run_cell', __profile_before)
+get_ipython().events.register('post_run_cell', __profile_after)
+"""
+
+
+def _run_silently(client, code, index):
+    """
+    run some code in the kernel, without touching the notebook
+    returns what the code printed
+    """
+    cell = nbformat.v4.new_code_cell(code)
+    # nbclient stores the executed cell in the notebook, at that index
+    cells = client.nb.cells
+    saved = cells[index] if index < len(cells) else None
+    client.execute_cell(cell, index, store_history=False)
+    if saved is not None:
+        cells[index] = saved
+    return "".join(output.get('text', '') for output in cell.outputs
+                   if output.output_type == 'stream')
+
+
+def profile_notebook(path, trace=True, timeout=None):
+    """
+    returns a list of dicts, one per code cell
+    """
+    path = Path(path)
+    notebook = jupytext.read(path)
+    kernel_name = (notebook.metadata
+                   .get('kernelspec', {}).get('name', 'python3'))
+    client = NotebookClient(
+        notebook, timeout=timeout, kernel_name=kernel_name,
+        resources={'metadata': {'path': str(path.parent)}})
+    records = []
+    with client.setup_kernel():
+        _run_silently(client, SETUP.format(trace=trace), 0)
+        for index, cell in enumerate(notebook.cells):
+            # nbclient does not even send empty cells to the kernel
+            if cell.cell_type != 'code' or not cell.source.strip():
+                continue
+            try:
+                client.execute_cell(cell, index)
+                failed = False
+            except CellExecutionError:
+                print(f"{path}[{index}]: failed")
+                failed = True
+            measures = json.loads(
+                _run_silently(client, "__profile_report()", index))
+            if measures is None:
+                # the kernel did not even run the cell
+                continue
+            first_line = next(
+                (line for line in cell.source.splitlines() if line.strip()),
+                "")
+            records.append(dict(notebook=str(path), cell=index,
+                                source=first_line, failed=failed,
+                                **measures))
+    return records
+
+
+def write_json(records, filename):
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, 'w') as writer:
+        json.dump(records, writer, indent=2)
+        writer.write("\n")
+
+
+# clicking a header sorts the table on that column
+SORT_SCRIPT = """
+document.querySelectorAll('th').forEach((th, column) => th.onclick = () => {
+    const tbody = th.closest('table').querySelector('tbody');
+    const value = (tr) => {
+        const text = tr.children[column].dataset.value;
+        return isNaN(text) ? text : parseFloat(text);
+    };
+    const reverse = th.dataset.reverse = th.dataset.reverse ? '' : 'yes';
+    Array.from(tbody.rows)
+        .sort((a, b) => (value(a) > value(b) ? 1 : -1) * (reverse ? -1 : 1))
+        .forEach(tr => tbody.appendChild(tr));
+});
+"""
+
+COLUMNS = [
+    # key, title, format
+    ('notebook', 'notebook', str),
+    ('cell', 'cell', str),
+    ('source', 'source', str),
+    ('wall', 'wall (s)', lambda x: f"{x:.3f}"),
+    ('cpu', 'cpu (s)', lambda x: f"{x:.3f}"),
+    ('peak_rss', 'peak RSS (MiB)', lambda x: f"{x / 2**20:.1f}"),
+    ('tracemalloc_peak', 'tracemalloc peak (MiB)',
+     lambda x: "" if x is None else f"{x / 2**20:.1f}"),
+]
+
+
+def write_html(records, filename):
+    header = "".join(f"<th>{title}</th>" for _, title, _ in COLUMNS)
+    rows = []
+    for record in records:
+        cells = "".join(
+            f'<td data-value="{html.escape(str(record[key] or 0))}">'
+            f'{html.escape(format(record[key]))}</td>'
+            for key, _, format in COLUMNS)
+        rows.append(f"<tr>{cells}</tr>")
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, 'w') as writer:
+        writer.write(
+            "<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+            "<title>cells profile</title><style>"
+            "th { cursor: pointer; } td, th { padding: 2px 8px; }"
+            "</style></head><body>\n"
+            f"<table><thead><tr>{header}</tr></thead><tbody>\n"
+            + "\n".join(rows)
+            + f"\n</tbody></table>\n<script>{SORT_SCRIPT}</script>"
+            "</body></html>\n")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--json", default=JSON)
+    parser.add_argument("--html", default=HTML)
+    parser.add_argument("--no-tracemalloc", dest='trace',
+                        action='store_false', default=True)
+    parser.add_argument("-t", "--timeout", type=int, default=None,
+                        help="timeout for each cell, in seconds")
+    parser.add_argument("-n", "--top", type=int, default=20,
+                        help="how many cells to show in the terminal")
+    parser.add_argument("notebooks", nargs="*",
+                        help="default is all the notebooks in the toc")
+    args = parser.parse_args()
+
+    notebooks = ([Path(notebook) for notebook in args.notebooks]
+                 or execute_book.toc_notebooks())
+    records = []
+    for notebook in notebooks:
+        print(f"profiling {notebook}")
+        records.extend(profile_notebook(
+            notebook, trace=args.trace, timeout=args.timeout))
+    records.sort(key=lambda record: record['wall'], reverse=True)
+    write_json(records, args.json)
+    write_html(records, args.html)
+    for record in records[:args.top]:
+        print(f"{record['wall']:8.3f}s {record['cpu']:8.3f}s "
+              f"{record['notebook']}[{record['cell']}] {record['source']}")
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,224 @@
+import re
+import json
+import hashlib
 from pathlib import Path
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
-import nbformat
-import jupytext
+# jupytext (and nbformat) are imported lazily, only when needed,
+# so that the fast path and no-op batch runs do not pay for the import
 
-def remove_correction(filecorr):
-    filecorr = Path(filecorr)
-    with filecorr.open() as f:
+# where the batch mode remembers what it has already produced
+MANIFEST = ".remove-correction.json"
+
+
+CELL_MARKER = "# %%"
+# what jupytext would consider as a cell marker in py:percent
+PERCENT_MARKERS = (
+    re.compile(r"^\s*#\s*%%(%*)\s(.*)$"),
+    re.compile(r"^\s*#\s*(%%|<codecell>|In\[[0-9 ]*\]:?)\s*$"),
+)
+# a markdown fence, like jupytext sees them
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+
+
+def is_correction(source):
+    return (not source
+            or source.startswith('# correction')
+            or source.startswith('#correction'))
+
+
+def strip_correction_jupytext(filecorr):
+    """
+    the reference implementation: load the notebook with jupytext,
+    drop the correction cells, and write it back as py:percent
+
+    returns a tuple (text, len_before, len_after)
+    """
+    import jupytext
+
+    with Path(filecorr).open() as f:
         notebook = jupytext.read(f)
-    filestud = filecorr.name.replace("+corr", "")
-    if filestud == filecorr.name:
-        print(f"cowardly refusing to overwrite {filecorr}")
-        return
     len_before = len(notebook['cells'])
-    def is_correction(cell):
-        source = cell['source']
-        return (not source 
-                or source.startswith('# correction')
-                or source.startswith('#correction'))
     notebook['cells'] = [cell for cell in notebook['cells']
-                         if not is_correction(cell)]
+                         if not is_correction(cell['source'])]
     len_after = len(notebook['cells'])
     # hard-code py-percent format
-    text = jupytext.writes(notebook, fmt='py:percent')
+    return jupytext.writes(notebook, fmt='py:percent'), len_before, len_after
+
+
+def _split_blanks(lines):
+    """
+    cut the trailing empty lines off a chunk of lines
+    returns a tuple (lines, nb_blanks)
+    """
+    end = len(lines)
+    while end and not lines[end-1]:
+        end -= 1
+    return lines[:end], len(lines) - end
+
+
+def _fences_are_closed(content):
+    """
+    jupytext ignores cell markers inside a fenced block in a markdown cell,
+    so we need these blocks to be closed within the cell
+    """
+    fence = None
+    for text in content:
+        match = FENCE.match(text)
+        if not match:
+            continue
+        chars, info = match.groups()
+        if fence is None:
+            if chars[0] == '`' and '`' in info:
+                continue
+            fence = chars
+        elif (chars[0] == fence[0] and len(chars) >= len(fence)
+              and not info.strip()):
+            fence = None
+    return fence is None
+
+
+def _cell_source(lines):
+    """
+    the source of a cell as jupytext would see it, or None if this
+    cell is not in the canonical form that jupytext would produce
+    """
+    marker, *content = lines
+    if not any(f"[{kind}]" in marker for kind in ('markdown', 'md', 'raw')):
+        # a cell marker inside a multi-line string is not a cell marker
+        text = "\n".join(content)
+        if text.count('"""') % 2 or text.count("'''") % 2:
+            return None
+        # jupytext comments out magics and shell commands
+        if any(line.lstrip().startswith(('%', '!')) for line in content):
+            return None
+        return text
+    # markdown and raw cells are fully commented out, the way
+    # jupytext does it: '# ' in front of each line, or a bare '#'
+    # for an empty line
+    if not all(line == '#' or line.startswith('# ') and line != '# '
+               for line in content):
+        return None
+    content = [line[2:] if line.startswith('# ') else line[1:]
+               for line in content]
+    if not _fences_are_closed(content):
+        return None
+    return "\n".join(content)
+
+
+def _next_is_def(lines):
+    """
+    a conservative version of jupytext's next_instruction_is_function_or_class
+    that may answer True more often, but never answers False wrongly
+    """
+    previous = None
+    for line in lines:
+        if not line.strip():
+            if previous is not None and not previous.strip():
+                return False
+        elif line.startswith(('def ', 'async ', 'class ')):
+            return True
+        elif not line.startswith(('#', '@', ' ', ')')):
+            return False
+        previous = line
+    return False
+
+
+def _flatten(chunks):
+    for lines, nb_blanks in chunks:
+        yield from lines
+        yield from [""] * nb_blanks
+
+
+def strip_correction_percent(text):
+    """
+    same as strip_correction_jupytext, but for a py:percent text, and
+    by scanning for the cell markers rather than building a notebook
+
+    returns None if the text is not in a shape where we can guarantee
+    to produce the same output as jupytext, in which case the caller
+    needs to go through the jupytext path
+    """
+    if '\r' in text:
+        return None
+    # jupytext writes whitespace-only lines as empty lines
+    if any(line and not line.strip() for line in text.splitlines()):
+        return None
+    header, cells = [], []
+    for line in text.splitlines():
+        if any(marker.match(line) for marker in PERCENT_MARKERS):
+            # the only flavour that jupytext writes
+            if not line.startswith(CELL_MARKER) or line.startswith("# %%%"):
+                return None
+            cells.append([line])
+        elif cells:
+            cells[-1].append(line)
+        else:
+            header.append(line)
+    if not cells:
+        return None
+    # the header must be made of comments only, in percent format
+    if not all(line.startswith('#') for line in header if line.strip()):
+        return None
+    if any('format_name:' in line and 'percent' not in line
+           for line in header):
+        return None
+
+    chunks = [_split_blanks(header)] + [_split_blanks(cell) for cell in cells]
+    keep = [True]
+    for lines, nb_blanks in chunks[1:]:
+        # jupytext would keep some of these blank lines in the cell
+        if nb_blanks > 2:
+            return None
+        source = _cell_source(lines)
+        if source is None:
+            return None
+        keep.append(not is_correction(source))
+    kept = [chunk for chunk, kept in zip(chunks, keep) if kept]
+    if len(kept) == 1:
+        return None
+
+    # jupytext recomputes the number of blank lines between a cell and the
+    # next one, so this changes when we drop cells; however it can only
+    # differ from 1 (which is what the text then has) when function or class
+    # definitions are involved, so we play it safe in that case
+    for index in range(len(chunks) - 1):
+        if not keep[index] or keep[index+1]:
+            continue
+        previous, _ = chunks[index]
+        if any(line.startswith(('def ', 'async ', 'class '))
+               for line in previous):
+            return None
+        if _next_is_def(_flatten(chunks[index+1:])):
+            return None
+        following = [chunk for chunk, kept
+                     in zip(chunks[index+1:], keep[index+1:]) if kept]
+        if _next_is_def(_flatten(following)):
+            return None
+
+    lines = list(_flatten(kept))
+    # jupytext adds a blank line after the very last cell
+    if keep[-1]:
+        lines.append("")
+    return "\n".join(lines), len(cells), len(kept) - 1
+
+
+def remove_correction(filecorr):
+    """
+    returns the path of the student file, or None if nothing was written
+    """
+    filecorr = Path(filecorr)
+    filestud = filecorr.name.replace("+corr", "")
+    if filestud == filecorr.name:
+        print(f"cowardly refusing to overwrite {filecorr}")
+        return None
+    result = None
+    if filecorr.suffix == '.py':
+        result = strip_correction_percent(filecorr.read_text())
+    if result is None:
+        result = strip_correction_jupytext(filecorr)
+    text, len_before, len_after = result
     with Path(filestud).open('w') as writer:
         writer.write(text)
         writer.write("\n")
@@ -30,18 +226,211 @@ def remove_correction(filecorr):
         print(f"{filecorr}[{len_before}] == no change")
     else:
         print(f"{filecorr}[{len_before}] -> {filestud}[{len_after}]")
+    return Path(filestud)
+
+
+# the cells that check() injects in the teacher files: correction cells,
+# and cells that jupytext would not write back as is
+INJECTED = (
+    ["# %%", "# correction", "answer = 42", ""],
+    ["# %%", "#correction", "def answer():", "    return 42", "", ""],
+    ["# %% [markdown]", "#hello", "#\thello", ""],
+    ["# %% [markdown]", "# hello", "# ", "# world", ""],
+    ["# %%", "%timeit a", "!ls", ""],
+    ["# %%", "a = 1", "    ", "b = 2", ""],
+)
+
+
+def variants(text):
+    """
+    copies of a py:percent text with correction cells injected,
+    before and after each function or class definition, at the
+    beginning, and at the end - the tricky spots for the fast path
+    """
+    lines = text.splitlines()
+    starts = [index for index, line in enumerate(lines)
+              if line.startswith(CELL_MARKER)]
+    if not starts:
+        return
+    positions = {starts[0], len(lines)}
+    for rank, start in enumerate(starts):
+        end = starts[rank+1] if rank + 1 < len(starts) else len(lines)
+        if any(line.startswith(('def ', 'async ', 'class '))
+               for line in lines[start:end]):
+            positions.update((start, end))
+    for position in sorted(positions):
+        for cell in INJECTED:
+            # at the very end, the previous cell needs its blank line
+            before = lines[:position]
+            if position == len(lines) and before and before[-1]:
+                before = before + [""]
+            yield "\n".join(before + cell + lines[position:]) + "\n"
+
+
+def _compare(file, text):
+    """
+    returns None if the fast path bails out, else whether it agrees
+    """
+    fast = strip_correction_percent(text)
+    if fast is None:
+        return None
+    return fast == strip_correction_jupytext(file)
+
+
+def check(files):
+    """
+    make sure the streaming stripper produces the same output as jupytext,
+    on the files themselves and on variants() of them
+
+    returns True if no discrepancy was found
+    """
+    import tempfile
+
+    ok = True
+    for file in files:
+        text = Path(file).read_text()
+        same = _compare(file, text)
+        if same is None:
+            print(f"{file}: jupytext only")
+        elif same:
+            print(f"{file}: identical")
+        else:
+            print(f"{file}: DIFFERENT")
+            ok = False
+        counts = dict(fast=0, total=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            variant = Path(tmp) / Path(file).name
+            for index, mutated in enumerate(variants(text)):
+                variant.write_text(mutated)
+                same = _compare(variant, mutated)
+                counts['total'] += 1
+                if same is None:
+                    continue
+                counts['fast'] += 1
+                if not same:
+                    print(f"{file}: DIFFERENT with injected cells,"
+                          f" variant #{index}")
+                    ok = False
+        print(f"{file}: {counts['fast']}/{counts['total']} variants"
+              f" through the fast path")
+    return ok
+
+
+def content_hash(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def load_manifest(manifest):
+    try:
+        with Path(manifest).open() as reader:
+            return json.load(reader)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest, entries):
+    with Path(manifest).open('w') as writer:
+        json.dump(entries, writer, indent=2, sort_keys=True)
+        writer.write("\n")
+
+
+def script_hash():
+    """
+    the hash of this very script, so that a change in the way we strip
+    the corrections invalidates what we produced before
+    """
+    return content_hash(__file__)
+
+
+def is_up_to_date(filecorr, entries, script=None):
+    """
+    a teacher file can be skipped if both its own contents and
+    the student file that we produced from it are unchanged,
+    and if it was produced by the same version of this script
+    """
+    entry = entries.get(str(filecorr))
+    if entry is None:
+        return False
+    if entry.get('script') != (script or script_hash()):
+        return False
+    filestud = Path(entry['student'])
+    if not filestud.exists():
+        return False
+    return (entry['source'] == content_hash(filecorr)
+            and entry['output'] == content_hash(filestud))
+
+
+def batch(files, jobs=None, manifest=MANIFEST):
+    """
+    same as calling remove_correction() on each file, but
+    * files that are up to date wrt the manifest are skipped
+    * the other ones are processed in a pool of processes
+    """
+    entries = load_manifest(manifest)
+    script = script_hash()
+    todo = []
+    for file in files:
+        if is_up_to_date(file, entries, script):
+            print(f"{file} == up to date")
+        else:
+            todo.append(file)
+    if not todo:
+        return
+    # no need to spawn a pool for a single file
+    if jobs == 1 or len(todo) == 1:
+        results = map(remove_correction, todo)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(remove_correction, todo)
+    try:
+        for file, filestud in zip(todo, results):
+            if filestud is None:
+                entries.pop(str(file), None)
+                continue
+            entries[str(file)] = dict(
+                source=content_hash(file),
+                student=str(filestud),
+                output=content_hash(filestud),
+                script=script,
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    save_manifest(manifest, entries)
 
 
 def main():
     parser = ArgumentParser()
+    parser.add_argument("-b", "--batch", action='store_true', default=False,
+                        help="skip unchanged files, and process the others"
+                             " in parallel")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes in batch mode"
+                             " - default is the number of cores")
+    parser.add_argument("-m", "--manifest", default=MANIFEST,
+                        help="where to store the content hashes in batch mode")
+    parser.add_argument("-c", "--check", action='store_true', default=False,
+                        help="do not write anything, just check that the fast"
+                             " path agrees with jupytext, also with correction"
+                             " cells injected (default is all files"
+                             " in .teacher/)")
     parser.add_argument("files", nargs="*")
     args = parser.parse_args()
 
+    if args.check:
+        files = args.files or sorted(Path('.teacher').glob('*.py'))
+        exit(0 if check(files) else 1)
+
     if not args.files:
         files = Path('.').glob('*+corr.py')
     else:
         files = [Path(file) for file in  args.files]
 
+    if args.batch:
+        batch(list(files), jobs=args.jobs, manifest=args.manifest)
+        return
+
     for file in files:
         remove_correction(file)
 
@@ -0,0 +1,294 @@
+"""
+produire et écrire du son par blocs, en mémoire constante
+cf. le TP sons (1-12-numpy-TP-sound), et media/pin-pon-*.wav
+
+plutôt que de calculer tout le signal dans un seul grand tableau,
+synthesize() est un générateur qui produit des blocs de taille fixe,
+calculés dans un buffer réutilisé, et write_wav() les écrit au fur
+et à mesure; la phase de chaque voix est conservée d'un bloc à l'autre
+(et d'une note à l'autre), il n'y a donc pas de clics aux jointures
+
+    >>> # une heure de pin-pon, fa puis sol, une seconde chacun
+    >>> score = [(1, [(FA, 0.5)]), (1, [(SOL, 0.5)])] * 1800
+    >>> write_wav("pin-pon.wav", synthesize(score))
+
+on y trouve aussi un Resampler, pour changer la fréquence
+d'échantillonnage d'un facteur up / down, lui aussi bloc par bloc
+cf. "exemple 2: ré-échantillonner un signal sonore" dans 2-10-timeseries
+
+et enfin open_wav(), qui donne accès aux échantillons d'un fichier wav
+sans le lire: c'est un np.memmap, seules les pages dont on se sert sont
+chargées, et windows() / spectrogram() le découpent en fenêtres glissantes
+qui sont elles aussi des vues, sans copie
+"""
+
+import wave
+import struct
+from math import gcd
+from pathlib import Path
+
+import numpy as np
+
+RATE = 44100
+BLOCK = 4096
+
+# quelques fréquences, en Hz
+LA = 440.
+SI = LA * 2 ** (2/12)
+FA = LA * 2 ** (-4/12)
+SOL = LA * 2 ** (-2/12)
+
+
+def synthesize(score, rate=RATE, block=BLOCK):
+    """
+    score est une liste de (durée en secondes, voix), où voix est
+    une liste de (fréquence, amplitude) jouées ensemble
+
+    génère des blocs de block échantillons (le dernier peut être plus
+    court), en flottants; c'est toujours le même buffer, il faut donc
+    s'en servir avant de demander le bloc suivant
+    """
+    buffer = np.empty(block)
+    temp = np.empty(block)
+    ramp = np.arange(block, dtype=float)
+    # la phase de chaque voix, d'un bloc et d'une note à l'autre
+    phases = []
+    # où on en est dans le bloc en cours
+    filled = 0
+    buffer[:] = 0
+    for duration, voices in score:
+        remaining = int(round(duration * rate))
+        phases.extend([0.] * (len(voices) - len(phases)))
+        while remaining:
+            size = min(remaining, block - filled)
+            out, tmp = buffer[filled:filled+size], temp[:size]
+            for index, (frequency, amplitude) in enumerate(voices):
+                step = 2 * np.pi * frequency / rate
+                # sin(phase + step * n), sans allouer
+                np.multiply(ramp[:size], step, out=tmp)
+                tmp += phases[index]
+                np.sin(tmp, out=tmp)
+                tmp *= amplitude
+                out += tmp
+                phases[index] = (phases[index] + step * size) % (2 * np.pi)
+            filled += size
+            remaining -= size
+            if filled == block:
+                yield buffer
+                buffer[:] = 0
+                filled = 0
+    if filled:
+        yield buffer[:filled]
+
+
+def write_wav(filename, blocks, rate=RATE):
+    """
+    écrit des blocs de flottants entre -1 et 1 dans un fichier wav
+    mono 16 bits, au fur et à mesure; retourne le nombre d'échantillons
+    """
+    samples = None
+    count = 0
+    with wave.open(str(filename), 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        for block in blocks:
+            if samples is None or len(samples) < len(block):
+                samples = np.empty(len(block), dtype='<i2')
+                scaled = np.empty(len(block))
+            out, tmp = samples[:len(block)], scaled[:len(block)]
+            np.multiply(block, 32767, out=tmp)
+            np.clip(tmp, -32768, 32767, out=tmp)
+            np.rint(tmp, out=tmp)
+            np.copyto(out, tmp, casting='unsafe')
+            writer.writeframes(memoryview(out).cast('B'))
+            count += len(block)
+    return count
+
+
+class Resampler:
+    """
+    ré-échantillonne un signal d'un facteur up / down (des entiers),
+    par filtrage polyphase: c'est équivalent à insérer up - 1 zéros
+    entre chaque échantillon, filtrer (passe-bas), puis garder un
+    échantillon sur down; mais on ne calcule que ce qu'on garde
+
+    le signal est traité bloc par bloc, avec process(); le filtre a
+    besoin des derniers échantillons du bloc précédent, que l'on garde
+    d'un appel à l'autre; à la fin, flush() produit les derniers
+    échantillons; au total on obtient ceil(n * up / down) échantillons,
+    alignés sur le signal d'origine (le retard du filtre est compensé)
+
+    half règle la longueur du filtre, et donc sa qualité
+    """
+    def __init__(self, up, down, half=10, beta=5.0):
+        divisor = gcd(up, down)
+        self.up, self.down = up // divisor, down // divisor
+        factor = max(self.up, self.down)
+        length = 2 * half * factor + 1
+        # un sinc fenêtré, coupant à la plus basse des deux fréquences
+        # de Nyquist, et de gain up pour compenser les zéros insérés
+        times = np.arange(length) - (length - 1) / 2
+        taps = np.sinc(times / factor) / factor * np.kaiser(length, beta)
+        taps *= self.up
+        # les up phases du filtre: phases[p, j] = taps[p + j * up]
+        self.width = -(-length // self.up)
+        padded = np.zeros(self.width * self.up)
+        padded[:length] = taps
+        # retournées, pour un simple produit scalaire avec l'entrée
+        self.phases = padded.reshape(self.width, self.up).T[:, ::-1].copy()
+        self.delay = (length - 1) // 2
+        # les width - 1 derniers échantillons vus, et leur position:
+        # au départ, des zéros avant le début du signal
+        self.state = np.zeros(self.width - 1)
+        self.start = -(self.width - 1)
+        self.consumed = 0
+        self.produced = 0
+
+    def _outputs(self, end):
+        """
+        le nombre de sorties calculables quand on a vu end échantillons:
+        la sortie m a besoin de l'entrée (m * down + delay) // up
+        """
+        return max(0, -(-(end * self.up - self.delay) // self.down))
+
+    def process(self, block):
+        """
+        retourne les échantillons de sortie que block permet de calculer
+        """
+        block = np.asarray(block, dtype=float)
+        signal = np.concatenate([self.state, block])
+        self.consumed += len(block)
+        begin, end = self.produced, self._outputs(self.consumed)
+        result = np.empty(max(0, end - begin))
+        if len(result):
+            # windows[k] = signal[k:k+width], sans copie
+            windows = np.lib.stride_tricks.sliding_window_view(
+                signal, self.width)
+            # les sorties m qui ont le même reste modulo up utilisent la
+            # même phase du filtre, et des entrées espacées de down
+            for first in range(begin, min(begin + self.up, end)):
+                position = first * self.down + self.delay
+                phase = self.phases[position % self.up]
+                # la fenêtre qui se termine sur l'entrée position // up
+                row = position // self.up - self.start - (self.width - 1)
+                count = len(range(first, end, self.up))
+                last = row + (count - 1) * self.down
+                rows = windows[row:last + 1:self.down]
+                # einsum est nettement plus rapide que @ sur ces lignes
+                # non contiguës, qu'il n'a pas besoin de recopier
+                np.einsum('ij,j->i', rows, phase,
+                          out=result[first - begin::self.up])
+        self.produced = end
+        keep = self.width - 1
+        self.state = signal[len(signal) - keep:] if keep else signal[:0]
+        self.start += len(signal) - len(self.state)
+        return result
+
+    def flush(self):
+        """
+        les dernières sorties, en complétant le signal avec des zéros
+        """
+        total = -(-self.consumed * self.up // self.down)
+        missing = total - self.produced
+        if missing <= 0:
+            return np.empty(0)
+        consumed = self.consumed
+        # de quoi calculer les sorties manquantes
+        padding = (missing * self.down) // self.up + self.width + 1
+        result = self.process(np.zeros(padding))[:missing]
+        self.consumed = consumed
+        self.produced = total
+        return result
+
+
+def resample(signal, up, down, block=2**16, **kwargs):
+    """
+    le signal entier, ré-échantillonné avec un Resampler
+    """
+    resampler = Resampler(up, down, **kwargs)
+    parts = [resampler.process(signal[beg:beg+block])
+             for beg in range(0, len(signal), block)]
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+# les formats de wav qu'on sait mapper directement
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+PCM_DTYPES = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
+FLOAT_DTYPES = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+
+def open_wav(filename):
+    """
+    retourne (rate, data) comme scipy.io.wavfile.read, mais data est
+    un np.memmap en lecture seule: rien n'est lu tant qu'on n'y touche pas
+
+    data est de forme (n,) en mono, et (n, channels) sinon
+    """
+    with open(filename, 'rb') as reader:
+        riff, _, kind = struct.unpack('<4sI4s', reader.read(12))
+        if riff != b'RIFF' or kind != b'WAVE':
+            raise ValueError(f"{filename}: not a wav file")
+        fmt = None
+        while True:
+            header = reader.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{filename}: no data chunk")
+            name, size = struct.unpack('<4sI', header)
+            if name == b'fmt ':
+                fmt = reader.read(size)
+            elif name == b'data':
+                offset = reader.tell()
+                break
+            else:
+                reader.seek(size, 1)
+            # les chunks sont alignés sur 2 octets
+            if size % 2:
+                reader.seek(1, 1)
+    if fmt is None:
+        raise ValueError(f"{filename}: no fmt chunk before data")
+    tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == WAVE_FORMAT_EXTENSIBLE:
+        # le vrai format est au début du GUID du sous-format
+        tag, = struct.unpack('<H', fmt[24:26])
+    width = bits // 8
+    dtypes = {WAVE_FORMAT_PCM: PCM_DTYPES,
+              WAVE_FORMAT_IEEE_FLOAT: FLOAT_DTYPES}.get(tag, {})
+    if width not in dtypes:
+        raise ValueError(f"{filename}: cannot map format {tag}"
+                         f" with {bits} bits per sample")
+    dtype = dtypes[width]
+    # un fichier tronqué annonce parfois plus qu'il ne contient
+    frames = min(size, Path(filename).stat().st_size - offset)
+    frames //= width * channels
+    shape = (frames,) if channels == 1 else (frames, channels)
+    return rate, np.memmap(filename, dtype=dtype, mode='r',
+                           offset=offset, shape=shape)
+
+
+def windows(data, size, step=None):
+    """
+    les fenêtres de size échantillons, tous les step échantillons
+    (par défaut step = size, des fenêtres qui ne se recouvrent pas)
+
+    c'est une vue: de forme (nombre de fenêtres, size) en mono, et
+    (nombre de fenêtres, channels, size) sinon; rien n'est copié
+    """
+    view = np.lib.stride_tricks.sliding_window_view(data, size, axis=0)
+    return view[::step or size]
+
+
+def spectrogram(data, size=2048, step=512, batch=256):
+    """
+    le module de la transformée de Fourier de chaque fenêtre (de Hann),
+    par paquets de batch fenêtres: un générateur de tableaux de forme
+    (batch, size // 2 + 1), qui ne lit le fichier qu'au fur et à mesure
+    """
+    frames = windows(data, size, step)
+    taper = np.hanning(size)
+    for beg in range(0, len(frames), batch):
+        yield np.abs(np.fft.rfft(frames[beg:beg+batch] * taper, axis=-1))
@@ -0,0 +1,153 @@
+"""
+traiter de très grandes images par bandes, sans jamais les charger en entier
+cf. les TPs image (1-06, 1-10), qui font la même chose sur les-mines.jpg
+
+l'image décodée est stockée dans un fichier .npy; on lui applique une
+suite d'opérations pixel par pixel (niveaux de gris, seuil...), bande de
+lignes par bande de lignes, éventuellement dans plusieurs processus, et
+le résultat est écrit dans un autre fichier .npy
+
+    >>> decode("les-mines.jpg", "mines.npy")
+    >>> process("mines.npy", "mines-bw.npy",
+    ...         [grayscale, partial(threshold, level=100)],
+    ...         crop=(slice(100, 400), slice(200, 600)), jobs=4)
+    >>> np.load("mines-bw.npy", mmap_mode='r')
+
+chaque bande est lue et écrite à travers un memmap qui ne couvre que
+cette bande, et qui est refermé aussitôt; la mémoire utilisée dépend
+donc de la taille des bandes, pas de celle de l'image
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# à peu près ce qu'on s'autorise pour une bande, temporaires compris
+BAND_BUDGET = 2**25
+
+
+def decode(image, npy, rows=512):
+    """
+    décode un fichier image (jpg, png...) dans un fichier .npy
+
+    pillow a besoin de l'image décodée en entier, mais on évite
+    au moins d'en faire une copie numpy complète
+    """
+    with Image.open(image) as img:
+        width, height = img.size
+        channels = len(img.getbands())
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        out = np.lib.format.open_memmap(npy, mode='w+', dtype=np.uint8,
+                                        shape=shape)
+        for beg in range(0, height, rows):
+            end = min(beg + rows, height)
+            out[beg:end] = np.asarray(img.crop((0, beg, width, end)))
+        out.flush()
+    del out
+
+
+def header(npy):
+    """
+    la forme, le type, et la position des données dans un fichier .npy
+    """
+    array = np.load(npy, mmap_mode='r')
+    if not array.flags.c_contiguous:
+        raise ValueError(f"{npy}: need a C-ordered array")
+    return array.shape, array.dtype, array.offset
+
+
+def open_band(npy, beg, end, mode='r'):
+    """
+    un memmap sur les lignes beg:end seulement du fichier .npy
+    """
+    shape, dtype, offset = header(npy)
+    row_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+    return np.memmap(npy, dtype=dtype, mode=mode,
+                     offset=offset + beg * row_bytes,
+                     shape=(end - beg, *shape[1:]))
+
+
+def apply(operations, data):
+    for operation in operations:
+        data = operation(data)
+    return data
+
+
+def _process_band(source, target, operations, rows, columns, beg, end):
+    """
+    ce qui tourne dans chaque processus: les lignes beg:end du résultat
+    """
+    band = open_band(source, rows.start + beg, rows.start + end)
+    result = apply(operations, band[:, columns])
+    out = open_band(target, beg, end, mode='r+')
+    out[...] = result
+    out.flush()
+    # on referme les deux memmaps, et leurs pages avec
+    del band, out
+
+
+def process(source, target, operations, crop=None, rows=None, jobs=1):
+    """
+    applique operations (une liste de fonctions, qui prennent et
+    rendent un tableau de pixels) à l'image du fichier source (.npy),
+    et écrit le résultat dans le fichier target (.npy)
+
+    crop est un couple de slices (lignes, colonnes), avec un pas de 1;
+    rows est la hauteur des bandes, calculée par défaut à partir de
+    BAND_BUDGET; avec jobs > 1, les bandes sont réparties sur autant
+    de processus, les opérations doivent alors être picklables
+    (des fonctions globales, ou des functools.partial)
+    """
+    shape, dtype, _ = header(source)
+    height, width = shape[:2]
+    line, columns = crop or (slice(None), slice(None))
+    line = slice(*line.indices(height))
+    columns = slice(*columns.indices(width))
+    if line.step != 1 or columns.step != 1:
+        raise ValueError("crop must use contiguous slices")
+    # le type et la forme d'un pixel du résultat, sur une seule ligne
+    sample = apply(operations, open_band(source, 0, 1)[:, columns])
+    out_shape = (line.stop - line.start, *sample.shape[1:])
+    out = np.lib.format.open_memmap(target, mode='w+', dtype=sample.dtype,
+                                    shape=out_shape)
+    del out
+    if rows is None:
+        # la bande source, le résultat, et quelques temporaires
+        row_bytes = sample[0].nbytes + dtype.itemsize * int(np.prod(shape[1:]))
+        rows = max(1, BAND_BUDGET // (4 * row_bytes))
+    bands = [(beg, min(beg + rows, out_shape[0]))
+             for beg in range(0, out_shape[0], rows)]
+    if jobs == 1:
+        for beg, end in bands:
+            _process_band(source, target, operations, line, columns, beg, end)
+        return
+    with ProcessPoolExecutor(jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(_process_band, source, target, operations,
+                               line, columns, beg, end)
+                   for beg, end in bands]
+        for future in futures:
+            future.result()
+
+
+########## quelques opérations pixel par pixel
+
+def grayscale(pixels):
+    """
+    RGB(A) -> niveaux de gris, avec les coefficients habituels
+    """
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gray = pixels[..., :3] @ weights
+    return gray.round().astype(np.uint8)
+
+
+def threshold(pixels, level=128):
+    """
+    noir et blanc: 255 au dessus de level, 0 sinon
+    """
+    return np.where(pixels > level, 255, 0).astype(np.uint8)
+
+
+def invert(pixels):
+    return 255 - pixels
@@ -0,0 +1,130 @@
+"""
+vérifier un produit matriciel en O(n²), sans le calculer
+cf. 1-13-numpy-linalg-optional, qui vérifie ses résultats avec
+np.isclose(np.dot(A_1, A), I) ou np.isclose(np.dot(A, x), b)
+
+calculer A @ X pour vérifier que ça vaut B coûte O(n³), autant que
+l'inversion elle-même; l'astuce de Freivalds consiste à tirer un vecteur
+r au hasard, et à comparer A @ (X @ r) et B @ r, soit trois produits
+matrice-vecteur en O(n²); si A @ X != B, un tirage a au moins une chance
+sur deux de s'en apercevoir, et avec t tirages on se trompe avec une
+probabilité d'au plus 2 ** -t
+
+    >>> check_inverse(A, np.linalg.inv(A))       # A @ A_inv ≈ I
+    >>> check_product(A, X, B, error=1e-12)      # A @ X ≈ B
+"""
+
+import math
+
+import numpy as np
+
+# en dessous de cette taille, on fait le calcul exact, qui est bon marché
+EXACT_BELOW = 64
+
+TRIALS = 20
+
+
+def error_bound(trials):
+    """
+    la probabilité d'accepter à tort, après trials tirages
+    """
+    return 2. ** -trials
+
+
+def trials_for(error):
+    """
+    le nombre de tirages pour que error_bound soit au plus error
+    """
+    return max(1, math.ceil(-math.log2(error)))
+
+
+def check_product(A, X, B=None, trials=None, error=None,
+                  rtol=1e-05, atol=1e-08, seed=None, exact_below=EXACT_BELOW):
+    """
+    vérifie que A @ X ≈ B (B=None veut dire l'identité)
+
+    sur les petites matrices, c'est np.allclose(A @ X, B, rtol, atol),
+    comme dans le notebook; sinon on fait trials tirages (par défaut
+    TRIALS, ou assez pour que error_bound(trials) <= error) de vecteurs
+    r de ±1, et on compare A @ (X @ r) et B @ r, ligne par ligne, avec la
+    tolérance que donnerait np.allclose sur toute la ligne:
+    n * atol + rtol * sum(|B[i, :]|)
+
+    donc: si A @ X ≈ B au sens de np.allclose, le test réussit toujours;
+    et si un seul coefficient de A @ X - B dépasse cette tolérance de
+    sa ligne, le test échoue avec une probabilité d'au moins
+    1 - error_bound(trials)
+    """
+    A, X = np.asarray(A), np.asarray(X)
+    n, m = A.shape[0], X.shape[1]
+    if A.shape[1] != X.shape[0] or (B is not None
+                                   and np.shape(B) != (n, m)):
+        raise ValueError("shapes do not match")
+    if B is None and n != m:
+        raise ValueError("A @ X must be square to be the identity")
+    if max(n, m) < exact_below:
+        expected = np.eye(n) if B is None else B
+        return np.allclose(A @ X, expected, rtol=rtol, atol=atol)
+    if trials is None:
+        trials = TRIALS if error is None else trials_for(error)
+    rng = np.random.default_rng(seed)
+    # tous les tirages d'un coup, un par colonne
+    r = rng.integers(0, 2, size=(m, trials)) * 2. - 1.
+    projected = A @ (X @ r)
+    if B is None:
+        # I @ r, et la tolérance de np.allclose sur une ligne de I
+        expected = r
+        tolerance = m * atol + rtol
+    else:
+        B = np.asarray(B)
+        expected = B @ r
+        tolerance = m * atol + rtol * np.abs(B).sum(axis=1, keepdims=True)
+    return bool(np.all(np.abs(projected - expected) <= tolerance))
+
+
+def check_inverse(A, A_inv, **kwargs):
+    """
+    vérifie que A @ A_inv ≈ I; mêmes options que check_product
+    """
+    return check_product(A, A_inv, None, **kwargs)
+
+
+def check_solve(A, x, b, **kwargs):
+    """
+    vérifie que A @ x ≈ b; si x est un vecteur, le calcul exact
+    est déjà en O(n²), sinon on passe par check_product
+    """
+    x = np.asarray(x)
+    if x.ndim == 1:
+        rtol, atol = kwargs.get('rtol', 1e-05), kwargs.get('atol', 1e-08)
+        return np.allclose(np.asarray(A) @ x, b, rtol=rtol, atol=atol)
+    return check_product(A, x, b, **kwargs)
+
+
+def crosscheck(n=300, seed=0):
+    """
+    compare avec le calcul exact, sur des résultats justes et faux;
+    retourne la liste des cas en désaccord
+    """
+    rng = np.random.default_rng(seed)
+    A = rng.normal(size=(n, n)) + n ** 0.5 * np.eye(n)
+    A_inv = np.linalg.inv(A)
+    X = rng.normal(size=(n, 3))
+    B = A @ X
+    wrong_inv, wrong_B = A_inv.copy(), B.copy()
+    wrong_inv[n // 2, n // 3] += 1e-3
+    wrong_B[n // 3, 1] += 1e-3
+    cases = [
+        ('inverse', check_inverse(A, A_inv, seed=seed), True),
+        ('inverse', check_inverse(A, wrong_inv, seed=seed), False),
+        ('solve', check_solve(A, X, B, seed=seed), True),
+        ('solve', check_solve(A, X, wrong_B, seed=seed), False),
+        ('solve', check_solve(A, X[:, 0], B[:, 0]), True),
+    ]
+    return [(name, expected) for name, result, expected in cases
+            if result != expected]
+
+
+if __name__ == '__main__':
+    errors = crosscheck()
+    print("OK" if not errors else f"KO {errors}")
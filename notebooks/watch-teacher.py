@@ -0,0 +1,184 @@
+"""
+a long-running process that regenerates the student notebooks
+as soon as a teacher notebook is saved
+
+the point is to pay the import cost (jupytext, nbformat, nbprune...)
+only once, rather than on each invocation of nbprune / nbnorm /
+remove-correction.py; on linux, .teacher/ is watched through inotify,
+elsewhere we fall back to polling
+
+for each saved file in .teacher/
+* with --norm, it is first normalized like 'make norm' does
+* the student version is produced like 'make prune' does
+* and for *+corr* files, like remove-correction.py does
+"""
+
+import os
+import sys
+import time
+import shlex
+import struct
+import ctypes
+import ctypes.util
+import importlib
+from pathlib import Path
+from argparse import ArgumentParser
+
+# all this is what we want to keep warm
+import jupytext
+import nbformat
+from nbprune import nbprune
+from nbnorm import nbnorm
+
+remove_correction = importlib.import_module("remove-correction")
+
+TEACHER = ".teacher"
+# same as in the Makefile
+NBNORMFLAGS = "-l1 -s2 -t h1 -L Licence -S 'HTML\\('"
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def inotify_watch(directory):
+    """
+    returns an inotify file descriptor that watches the files
+    written in directory; raises OSError if inotify is not available
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    try:
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except AttributeError:
+        raise OSError("no inotify on this system")
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1")
+    # editors often save through a rename, hence IN_MOVED_TO
+    if libc.inotify_add_watch(fd, os.fsencode(directory),
+                              IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        raise OSError(ctypes.get_errno(), f"inotify_add_watch {directory}")
+    return fd
+
+
+def inotify_events(fd):
+    """
+    yields batches of the names of the files that were written
+    """
+    try:
+        while True:
+            buffer = os.read(fd, 64 * 1024)
+            names = set()
+            offset = 0
+            while offset < len(buffer):
+                _, _, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name = buffer[offset:offset+length].rstrip(b'\0')
+                offset += length
+                names.add(os.fsdecode(name))
+            yield names
+    finally:
+        os.close(fd)
+
+
+def polling_events(directory, period=0.5):
+    """
+    same as inotify_events, for the systems that do not have inotify
+    """
+    def mtimes():
+        return {path.name: path.stat().st_mtime
+                for path in Path(directory).iterdir() if path.is_file()}
+    previous = mtimes()
+    while True:
+        time.sleep(period)
+        current = mtimes()
+        names = {name for name, mtime in current.items()
+                 if previous.get(name) != mtime}
+        previous = current
+        if names:
+            yield names
+
+
+def is_notebook(name):
+    # skip editor backups and the like
+    return (not name.startswith(('.', '#', '~'))
+            and name.endswith(('.py', '.md')))
+
+
+def normalize(path, flags):
+    saved = sys.argv
+    sys.argv = ['nbnorm', *shlex.split(flags), str(path)]
+    try:
+        nbnorm.main()
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = saved
+
+
+def regenerate(path, norm_flags=None):
+    if norm_flags is not None:
+        normalize(path, norm_flags)
+    if '+corr' in path.name:
+        remove_correction.remove_correction(path)
+        return
+    student = nbprune.output_filename(str(path))
+    if student is None:
+        print(f"{path}: cannot guess the student filename, ignored")
+        return
+    nbprune.prune_solution(str(path), student)
+    print(f"{path} -> {student}")
+
+
+def watch(directory=TEACHER, norm_flags=None):
+    try:
+        batches = inotify_events(inotify_watch(directory))
+    except OSError:
+        batches = polling_events(directory)
+    # the contents we have last processed, so that we can ignore
+    # the events caused by our own writes (in --norm mode),
+    # and the saves that do not change anything
+    processed = {}
+    print(f"watching {directory}")
+    for names in batches:
+        for name in sorted(names):
+            if not is_notebook(name):
+                continue
+            path = Path(directory) / name
+            try:
+                contents = path.read_bytes()
+            except FileNotFoundError:
+                continue
+            if processed.get(path) == contents:
+                continue
+            beg = time.perf_counter()
+            try:
+                regenerate(path, norm_flags)
+            except Exception as exc:
+                print(f"{path}: {type(exc).__name__}: {exc}")
+            # the file may have been renamed away meanwhile, e.g. by
+            # an editor that saves through a temporary file
+            try:
+                processed[path] = path.read_bytes()
+            except FileNotFoundError:
+                processed.pop(path, None)
+            print(f"{path}: {(time.perf_counter() - beg)*1000:.0f} ms")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", "--directory", default=TEACHER)
+    parser.add_argument("-n", "--norm", action='store_true', default=False,
+                        help="also normalize the teacher notebook on save")
+    parser.add_argument("--norm-flags", default=NBNORMFLAGS,
+                        help="the options passed to nbnorm with --norm")
+    args = parser.parse_args()
+
+    try:
+        watch(args.directory, args.norm_flags if args.norm else None)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()